@@ -0,0 +1,92 @@
+import asyncio
+from dm_dispatcher import dm_dispatcher
+from metrics import Gauge
+
+# Keep digests inside Discord's 2000 character message limit
+MAX_DIGEST_LENGTH = 1900
+
+DIGESTS_PENDING = Gauge('alert_digests_pending', 'Users with a digest window open')
+
+
+class ChannelHits:
+    """Matches from one channel within a digest window"""
+    __slots__ = ('server', 'channel', 'count', 'authors', 'last_message', 'last_url')
+
+    def __init__(self, server, channel):
+        self.server = server
+        self.channel = channel
+        self.count = 0
+        self.authors = set()
+        self.last_message = ''
+        self.last_url = ''
+
+
+class AlertDigest:
+    """Batches a user's alerts over their digest window into a single DM"""
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.pending = {}   # user_id -> {channel_id: ChannelHits}
+        self._guilds = {}   # user_id -> guild to resolve the user through
+        self._timers = {}
+
+    def add(self, user_id, window, message):
+        """Record a match; the first one for a user starts their digest window"""
+        channels = self.pending.get(user_id)
+        if channels is None:
+            channels = self.pending[user_id] = {}
+            self._guilds[user_id] = message.guild
+            self._timers[user_id] = asyncio.get_running_loop().call_later(window, self.flush, user_id)
+
+        # Repeated hits from the same channel collapse into one line
+        hits = channels.get(message.channel.id)
+        if hits is None:
+            hits = channels[message.channel.id] = ChannelHits(
+                message.guild.name if message.guild else 'DM',
+                message.channel.mention if hasattr(message.channel, 'mention') else 'DM'
+            )
+        hits.count += 1
+        hits.authors.add(message.author.name)
+        hits.last_message = message.content[:100]
+        hits.last_url = message.jump_url
+
+    def flush(self, user_id):
+        """Send a user's pending digest now"""
+        channels = self.pending.pop(user_id, None)
+        guild = self._guilds.pop(user_id, None)
+        timer = self._timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        if channels:
+            self.dispatcher.enqueue(user_id, format_digest(channels.values()), guild)
+
+    def flush_all(self):
+        """Send every pending digest, e.g. before shutting down"""
+        for user_id in list(self.pending):
+            self.flush(user_id)
+
+
+def format_digest(channel_hits):
+    """Build the digest DM text, one line per channel"""
+    channel_hits = sorted(channel_hits, key=lambda hits: hits.count, reverse=True)
+    total = sum(hits.count for hits in channel_hits)
+    lines = [f"**Alert digest:** {total} message(s) in {len(channel_hits)} channel(s)\n"]
+    length = len(lines[0])
+
+    for i, hits in enumerate(channel_hits):
+        line = (
+            f"**{hits.server}** {hits.channel} - {hits.count} message(s) from {', '.join(sorted(hits.authors)[:3])}\n"
+            f"> {hits.last_message}\n"
+            f"[Jump to latest]({hits.last_url})\n"
+        )
+        if length + len(line) > MAX_DIGEST_LENGTH:
+            lines.append(f"...and {len(channel_hits) - i} more channel(s)")
+            break
+        lines.append(line)
+        length += len(line)
+
+    return '\n'.join(lines)
+
+# Global instance
+alert_digest = AlertDigest(dm_dispatcher)
+DIGESTS_PENDING.set_function(lambda: len(alert_digest.pending))
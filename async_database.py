@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from metrics import Gauge, Histogram
+
+# Never run more DB threads than there are pooled connections for them to use
+DB_EXECUTOR_WORKERS = int(os.environ.get('DB_EXECUTOR_WORKERS', database.DB_POOL_SIZE))
+
+DB_CALL_SECONDS = Histogram('db_call_seconds', 'Latency of each database.py function, including executor queueing', ['function'])
+DB_EXECUTOR_WAIT_SECONDS = Histogram('db_executor_wait_seconds', 'Time database calls spend queued for an executor thread')
+DB_EXECUTOR_PENDING = Gauge('db_executor_pending', 'Database calls queued or running in the executor')
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Pooled connections checked out')
+DB_POOL_WAITS = Gauge('db_pool_waits', 'Checkouts that had to wait for a free connection')
+
+
+class DatabaseExecutor:
+    """Bounded thread pool that keeps blocking psycopg2 calls off the event loop"""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+        # Only touched from the event loop thread, so no locking needed
+        self.pending = 0        # Calls queued or running right now
+        self.calls = 0
+        self.total_wait = 0.0   # Seconds spent queued before a worker picked the call up
+        self.max_wait = 0.0
+
+    async def run(self, func, *args):
+        """Run a blocking database function in the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+
+        def call():
+            waited = time.perf_counter() - queued_at
+            return waited, func(*args)
+
+        self.pending += 1
+        try:
+            waited, result = await loop.run_in_executor(self._executor, call)
+        finally:
+            self.pending -= 1
+
+        DB_EXECUTOR_WAIT_SECONDS.observe(waited)
+        self.calls += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return result
+
+    def stats(self):
+        """Queue depth and queue-wait figures for the executor"""
+        return {
+            'workers': self.max_workers,
+            'pending': self.pending,
+            'calls': self.calls,
+            'avg_wait_ms': (self.total_wait / self.calls * 1000) if self.calls else 0.0,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+# Global instance
+db_executor = DatabaseExecutor(DB_EXECUTOR_WORKERS)
+DB_EXECUTOR_PENDING.set_function(lambda: db_executor.pending)
+DB_POOL_IN_USE.set_function(lambda: database.get_pool_stats()['in_use'])
+DB_POOL_WAITS.set_function(lambda: database.get_pool_stats()['waits'])
+
+
+def _run_in_executor(func):
+    """Wrap a blocking database function as a coroutine that runs in db_executor"""
+    latency = DB_CALL_SECONDS.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args):
+        started = time.perf_counter()
+        try:
+            return await db_executor.run(func, *args)
+        finally:
+            latency.observe(time.perf_counter() - started)
+    return wrapper
+
+
+init_connection_pool = _run_in_executor(database.init_connection_pool)
+init_db = _run_in_executor(database.init_db)
+load_trigger_index = _run_in_executor(database.load_trigger_index)
+load_notification_preferences = _run_in_executor(database.load_notification_preferences)
+open_listen_connection = _run_in_executor(database.open_listen_connection)
+open_dedicated_connection = _run_in_executor(database.open_dedicated_connection)
+try_leader_lock = _run_in_executor(database.try_leader_lock)
+check_connection = _run_in_executor(database.check_connection)
+publish_reload_marker = _run_in_executor(database.publish_reload_marker)
+
+get_user_triggers = _run_in_executor(database.get_user_triggers)
+get_all_users_monitoring = _run_in_executor(database.get_all_users_monitoring)
+add_trigger_word = _run_in_executor(database.add_trigger_word)
+add_multiple_trigger_words = _run_in_executor(database.add_multiple_trigger_words)
+remove_trigger_word = _run_in_executor(database.remove_trigger_word)
+is_notifications_enabled = _run_in_executor(database.is_notifications_enabled)
+toggle_notifications = _run_in_executor(database.toggle_notifications)
+set_digest_window = _run_in_executor(database.set_digest_window)
+
+add_token_monitor = _run_in_executor(database.add_token_monitor)
+remove_token_monitor = _run_in_executor(database.remove_token_monitor)
+get_all_monitored_tokens = _run_in_executor(database.get_all_monitored_tokens)
+update_last_checked = _run_in_executor(database.update_last_checked)
+get_poll_schedule = _run_in_executor(database.get_poll_schedule)
+update_poll_schedule = _run_in_executor(database.update_poll_schedule)
+add_claim_event = _run_in_executor(database.add_claim_event)
+ingest_claim_events = _run_in_executor(database.ingest_claim_events)
+get_unnotified_claim_events = _run_in_executor(database.get_unnotified_claim_events)
+mark_claim_event_notified = _run_in_executor(database.mark_claim_event_notified)
+mark_claim_events_notified = _run_in_executor(database.mark_claim_events_notified)
+
+get_bot_state = _run_in_executor(database.get_bot_state)
+set_bot_state = _run_in_executor(database.set_bot_state)
@@ -1,13 +1,58 @@
-import requests
+import aiohttp
 import asyncio
+import logging
 import time
 import discord
 from typing import List, Dict, Any, Optional
-from database import get_all_monitored_tokens, add_claim_event, update_last_checked, get_unnotified_claim_events, mark_claim_event_notified
+from metrics import Counter, Histogram
+from rate_limit import TokenBucket, parse_retry_after
+from async_database import get_poll_schedule, update_poll_schedule, ingest_claim_events, get_unnotified_claim_events, mark_claim_events_notified
 
 import os
 BAGS_API_KEY = os.environ.get('BAGS_API_KEY')
-BAGS_API_BASE_URL = "https://public-api-v2.bags.fm/api/v1"
+BAGS_API_BASE_URL = os.environ.get('BAGS_API_BASE_URL', "https://public-api-v2.bags.fm/api/v1")
+BAGS_API_TIMEOUT = float(os.environ.get('BAGS_API_TIMEOUT', '15'))  # Seconds per request
+BAGS_API_MAX_CONNECTIONS = int(os.environ.get('BAGS_API_MAX_CONNECTIONS', '10'))
+BAGS_API_RATE_LIMIT = float(os.environ.get('BAGS_API_RATE_LIMIT', '10'))  # Requests per second across all pollers
+BAGS_API_MAX_RETRIES = int(os.environ.get('BAGS_API_MAX_RETRIES', '3'))
+BAGS_POLL_CONCURRENCY = int(os.environ.get('BAGS_POLL_CONCURRENCY', '5'))
+
+# Adaptive polling: a token is polled every BAGS_POLL_MIN_INTERVAL seconds after a
+# claim, backing off by BAGS_POLL_BACKOFF per quiet poll up to BAGS_POLL_MAX_INTERVAL
+BAGS_POLL_MIN_INTERVAL = int(os.environ.get('BAGS_POLL_MIN_INTERVAL', '60'))
+BAGS_POLL_MAX_INTERVAL = int(os.environ.get('BAGS_POLL_MAX_INTERVAL', '3600'))
+BAGS_POLL_BACKOFF = float(os.environ.get('BAGS_POLL_BACKOFF', '2'))
+BAGS_PAGE_SIZE = int(os.environ.get('BAGS_PAGE_SIZE', '100'))
+BAGS_MAX_PAGES = int(os.environ.get('BAGS_MAX_PAGES', '50'))  # Pages fetched per poll; deeper bursts resume on the next poll
+BAGS_SCHEDULER_TICK = float(os.environ.get('BAGS_SCHEDULER_TICK', '10'))  # Seconds between due-token checks
+
+# Push mode: claim events arrive through webhook_server and polling only reconciles
+BAGS_WEBHOOK_PORT = os.environ.get('BAGS_WEBHOOK_PORT')
+BAGS_RECONCILE_INTERVAL = int(os.environ.get('BAGS_RECONCILE_INTERVAL', '1800'))  # Min poll interval in push mode
+
+CLAIM_OUTBOX_BATCH = int(os.environ.get('CLAIM_OUTBOX_BATCH', '100'))  # Unnotified rows read per query
+CLAIM_EMBEDS_PER_MESSAGE = 10  # Discord's limit
+CLAIM_DELIVERY_RETRY = int(os.environ.get('CLAIM_DELIVERY_RETRY', '600'))  # Seconds to hold delivery when the channel is gone or forbidden
+
+logger = logging.getLogger(__name__)
+
+BAGS_API_SECONDS = Histogram('bags_api_request_seconds', 'Latency of one Bags API claim-events request')
+BAGS_API_ERRORS = Counter('bags_api_errors_total', 'Bags API requests that failed or were rate limited')
+BAGS_SWEEP_SECONDS = Histogram('bags_sweep_seconds', 'Time to poll every due token once')
+BAGS_SWEEP_TOKENS = Histogram('bags_sweep_tokens', 'Tokens polled per sweep', buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000))
+CLAIMS_FOUND = Counter('claim_events_new_total', 'New claim events stored from polls and webhooks')
+CLAIMS_DELIVERED = Counter('claim_events_delivered_total', 'Claim events announced from the outbox')
+CLAIMS_REJECTED = Counter('claim_events_rejected_total', 'Claim events Discord refused to post, marked notified to unblock the outbox')
+CLAIM_DELIVERY_ERRORS = Counter('claim_delivery_errors_total', 'Outbox deliveries that failed and were left for a later attempt')
+
+def next_poll_interval(current: Optional[int], had_claims: bool) -> int:
+    """Shorten the interval after activity, back off exponentially while quiet"""
+    # With webhooks delivering claims, polling is only a slow safety net
+    min_interval = max(BAGS_POLL_MIN_INTERVAL, BAGS_RECONCILE_INTERVAL) if BAGS_WEBHOOK_PORT else BAGS_POLL_MIN_INTERVAL
+    max_interval = max(min_interval, BAGS_POLL_MAX_INTERVAL)
+    if had_claims or not current:
+        return min_interval
+    return max(min_interval, min(int(current * BAGS_POLL_BACKOFF), max_interval))
 
 class BagsAPIService:
     def __init__(self):
@@ -19,6 +64,36 @@ class BagsAPIService:
             'x-api-key': self.api_key,
             'Content-Type': 'application/json'
         }
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.rate_limiter = TokenBucket(BAGS_API_RATE_LIMIT, name='bags_api')
+        # Set when claim events arrive outside the poller (or a token is added),
+        # to deliver them and poll due tokens right away
+        self.claims_pending = asyncio.Event()
+        # token_mint -> (offset to resume paging at, newest signature when the backlog began)
+        # for tokens with more new claims than one poll fetches
+        self.claim_backlog: Dict[str, tuple] = {}
+    
+    def wake(self):
+        """Run the monitoring loop now instead of at its next tick, e.g. for a new token"""
+        self.claims_pending.set()
+    
+    async def start(self):
+        """Open the shared keep-alive HTTP session (safe to call more than once)"""
+        if self.session and not self.session.closed:
+            return
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=BAGS_API_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=BAGS_API_MAX_CONNECTIONS)
+        )
+        logger.debug("Bags API session opened")
+    
+    async def close(self):
+        """Close the HTTP session and its pooled connections"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+            logger.debug("Bags API session closed")
+        self.session = None
     
     async def get_token_claim_events(self, token_mint: str, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
         """Get claim events for a specific token"""
@@ -29,137 +104,280 @@ class BagsAPIService:
             'offset': offset
         }
         
-        try:
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching claim events for {token_mint}: {e}")
-            return {"success": False, "error": str(e)}
+        await self.start()
+        for attempt in range(BAGS_API_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                async with self.session.get(url, params=params) as response:
+                    if response.status == 429 and attempt < BAGS_API_MAX_RETRIES:
+                        # Over quota: hold every poller, not just this one
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'), attempt)
+                        self.rate_limiter.pause(retry_after)
+                        BAGS_API_ERRORS.inc()
+                        logger.warning("Bags API rate limited, backing off for %.1fs", retry_after)
+                        continue
+                    response.raise_for_status()
+                    return await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                BAGS_API_ERRORS.inc()
+                logger.warning("Error fetching claim events for %s: %r", token_mint, e)
+                return {"success": False, "error": str(e)}
+            finally:
+                BAGS_API_SECONDS.observe(time.perf_counter() - started)
     
     async def check_new_claims_for_all_tokens(self) -> List[Dict[str, Any]]:
-        """Check for new claim events for all monitored tokens"""
-        monitored_tokens = get_all_monitored_tokens()
-        new_events = []
+        """Check for new claim events for all monitored tokens, due or not"""
+        return await self.check_tokens(await get_poll_schedule(False))
+    
+    async def check_due_tokens(self) -> List[Dict[str, Any]]:
+        """Check for new claim events for tokens whose next poll is due"""
+        return await self.check_tokens(await get_poll_schedule(True))
+    
+    async def check_tokens(self, schedule) -> List[Dict[str, Any]]:
+        """Poll (token_mint, poll_interval, last_seen_signature) rows concurrently"""
+        # Poll several tokens at once; the token bucket enforces the API quota
+        semaphore = asyncio.Semaphore(BAGS_POLL_CONCURRENCY)
         
-        for token_mint, added_by, added_at in monitored_tokens:
-            try:
-                # Get recent claim events
-                result = await self.get_token_claim_events(token_mint)
-                
-                if result.get('success') and 'response' in result:
-                    events = result['response'].get('events', [])
-                    
-                    # Process each event
-                    for event in events:
-                        signature = event.get('signature')
-                        wallet = event.get('wallet')
-                        is_creator = event.get('isCreator', False)
-                        amount = event.get('amount')
-                        timestamp = event.get('timestamp')
-                        
-                        # Add to database if new
-                        if add_claim_event(signature, token_mint, wallet, is_creator, amount, timestamp):
-                            new_events.append({
-                                'signature': signature,
-                                'token_mint': token_mint,
-                                'wallet': wallet,
-                                'is_creator': is_creator,
-                                'amount': amount,
-                                'timestamp': timestamp
-                            })
-                
-                # Update last checked time
-                update_last_checked(token_mint)
-                
-                # Rate limit to avoid hitting API limits
-                await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                print(f"Error checking token {token_mint}: {e}")
+        async def check(token_mint, poll_interval, last_seen_signature):
+            async with semaphore:
+                return await self.check_new_claims_for_token(token_mint, poll_interval, last_seen_signature)
+        
+        with BAGS_SWEEP_SECONDS.time():
+            results = await asyncio.gather(*(check(*row) for row in schedule))
+        BAGS_SWEEP_TOKENS.observe(len(schedule))
+        return [event for events in results for event in events]
+    
+    async def fetch_claim_events_since(self, token_mint: str, last_seen_signature: Optional[str]):
+        """Page through a token's claim events (newest first) until reaching the cursor
+
+        Returns (events, cursor). `cursor` is the newest signature once every page
+        back to the old cursor has been fetched, or None if the old cursor must
+        stay put because a page failed or the backlog is deeper than
+        BAGS_MAX_PAGES. In the latter case the next call resumes paging where
+        this one stopped. Without a cursor only the first page is fetched.
+        """
+        # New claims only push older ones further back, so resuming from a saved
+        # offset may refetch a few events (deduplicated on insert) but never skips any
+        start_offset, newest = self.claim_backlog.pop(token_mint, (0, None))
+        events = []
+        for page in range(BAGS_MAX_PAGES):
+            offset = start_offset + page * BAGS_PAGE_SIZE
+            result = await self.get_token_claim_events(token_mint, limit=BAGS_PAGE_SIZE, offset=offset)
+            if not (result.get('success') and 'response' in result):
+                if start_offset:
+                    self.claim_backlog[token_mint] = (start_offset, newest)
+                return events, None
+            
+            page_events = result['response'].get('events', [])
+            if newest is None and page_events:
+                newest = page_events[0].get('signature')
+            for event in page_events:
+                if event.get('signature') == last_seen_signature:
+                    return events, newest
+                events.append(event)
+            
+            if last_seen_signature is None or len(page_events) < BAGS_PAGE_SIZE:
+                return events, newest
+        
+        offset = start_offset + BAGS_MAX_PAGES * BAGS_PAGE_SIZE
+        self.claim_backlog[token_mint] = (offset, newest)
+        logger.warning("Token %s has more than %s pages of new claims, continuing from offset %s on the next poll",
+                       token_mint, BAGS_MAX_PAGES, offset)
+        return events, None
+    
+    async def check_new_claims_for_token(self, token_mint: str, poll_interval: Optional[int] = None,
+                                         last_seen_signature: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Check for claim events newer than the token's cursor and schedule its next poll"""
+        poll_intervals = (next_poll_interval(poll_interval, True), next_poll_interval(poll_interval, False))
+        try:
+            # The cursor only advances once every page back to the old one is in
+            events, cursor = await self.fetch_claim_events_since(token_mint, last_seen_signature)
+            
+            # Insert the whole batch, update the schedule and learn which events
+            # were new in a single transaction
+            rows = await ingest_claim_events(token_mint, claim_event_rows(events), poll_intervals, cursor)
+            CLAIMS_FOUND.inc(len(rows))
+            return [claim_event_dict(token_mint, row) for row in rows]
+            
+        except Exception as e:
+            logger.error("Error checking token %s: %s", token_mint, e)
+        
+        try:
+            # Failed polls back off too, so a broken token isn't retried every tick
+            await update_poll_schedule(token_mint, poll_intervals[1], False)
+        except Exception as e:
+            logger.error("Error scheduling token %s: %s", token_mint, e)
         
-        return new_events
+        return []
+
+    async def ingest_pushed_events(self, token_mint: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Store claim events pushed to us and wake the notifier; returns the new ones"""
+        rows = await ingest_claim_events(token_mint, claim_event_rows(events))
+        CLAIMS_FOUND.inc(len(rows))
+        if rows:
+            self.claims_pending.set()
+        return [claim_event_dict(token_mint, row) for row in rows]
+
+def claim_event_rows(events: List[Dict[str, Any]]) -> List[tuple]:
+    """Convert API claim events to (signature, wallet, is_creator, amount, timestamp) rows"""
+    return [
+        (event['signature'], event.get('wallet'), event.get('isCreator', False), event.get('amount'), event.get('timestamp'))
+        for event in events
+        if event.get('signature')
+    ]
+
+def claim_event_dict(token_mint: str, row) -> Dict[str, Any]:
+    """Convert a claim event row back to the dict shape used for notifications"""
+    signature, wallet, is_creator, amount, timestamp = row
+    return {
+        'signature': signature,
+        'token_mint': token_mint,
+        'wallet': wallet,
+        'is_creator': is_creator,
+        'amount': amount,
+        'timestamp': timestamp
+    }
 
 # Global instance
 bags_service = BagsAPIService()
 
 async def start_monitoring_loop(bot, notification_channel_id: int):
     """Background task to monitor fee claim events"""
-    print("Starting Bags API monitoring loop...")
+    logger.info("Starting Bags API monitoring loop")
+    delivery = ClaimDelivery(bot, notification_channel_id)
     
     while True:
         try:
-            # Check for new claim events
-            new_events = await bags_service.check_new_claims_for_all_tokens()
+            # Deliver anything left unnotified first, including rows a previous
+            # run inserted but crashed before announcing
+            await delivery.deliver()
+            
+            # Check for new claim events on tokens that are due
+            new_events = await bags_service.check_due_tokens()
             
             if new_events:
-                print(f"Found {len(new_events)} new claim events")
-                
-                # Get notification channel
-                channel = bot.get_channel(notification_channel_id)
-                if not channel:
-                    print(f"Could not find notification channel {notification_channel_id}")
-                    await asyncio.sleep(60)  # Wait longer if channel not found
-                    continue
-                
-                # Send notifications for each new event
-                for event in new_events:
-                    await send_claim_notification(channel, event)
-                    mark_claim_event_notified(event['signature'])
+                logger.info("Found %s new claim events", len(new_events))
+                await delivery.deliver()
             
-            # Check every 2 minutes to respect rate limits
-            await asyncio.sleep(120)
+            # Each token has its own schedule; just look for newly due ones,
+            # waking early if a webhook delivered new claims
+            try:
+                await asyncio.wait_for(bags_service.claims_pending.wait(), BAGS_SCHEDULER_TICK)
+            except asyncio.TimeoutError:
+                pass
+            bags_service.claims_pending.clear()
             
         except Exception as e:
-            print(f"Error in monitoring loop: {e}")
+            logger.exception("Error in monitoring loop: %s", e)
             await asyncio.sleep(60)  # Wait before retrying
 
-async def send_claim_notification(channel, event: Dict[str, Any]):
-    """Send a notification about a new claim event"""
-    try:
-        embed = {
-            "title": "💰 New Fee Claim Detected!",
-            "description": f"Someone claimed fees from a monitored token!",
-            "color": 0x00ff00,
-            "fields": [
-                {
-                    "name": "Token Mint",
-                    "value": f"`{event['token_mint']}`",
-                    "inline": False
-                },
-                {
-                    "name": "Claimer Wallet",
-                    "value": f"`{event['wallet']}`",
-                    "inline": True
-                },
-                {
-                    "name": "Is Creator",
-                    "value": "Yes" if event['is_creator'] else "No",
-                    "inline": True
-                },
-                {
-                    "name": "Amount Claimed",
-                    "value": f"🪙 {event['amount']} SOL",
-                    "inline": True
-                },
-                {
-                    "name": "Timestamp",
-                    "value": f"<t:{int(time.time())}:R>",  # Discord timestamp
-                    "inline": True
-                },
-                {
-                    "name": "Transaction",
-                    "value": f"[View on Solana Explorer](https://solscan.io/tx/{event['signature']})",
-                    "inline": False
-                }
-            ],
-            "footer": {
-                "text": "Bags Fee Claim Monitor"
-            }
-        }
+class ClaimDelivery:
+    """Announces the outbox without letting delivery failures stop polling
+
+    Claims stay in the outbox until they are sent, so nothing is lost while the
+    channel is unreachable; a missing or forbidden channel just holds delivery
+    for CLAIM_DELIVERY_RETRY seconds instead of failing every tick.
+    """
+
+    def __init__(self, bot, notification_channel_id: int):
+        self.bot = bot
+        self.notification_channel_id = notification_channel_id
+        self.held_until = 0.0
+
+    async def deliver(self) -> int:
+        if time.monotonic() < self.held_until:
+            return 0
+        try:
+            return await deliver_pending_claims(self.bot, self.notification_channel_id)
+        except (discord.Forbidden, discord.NotFound) as e:
+            self.held_until = time.monotonic() + CLAIM_DELIVERY_RETRY
+            CLAIM_DELIVERY_ERRORS.inc()
+            logger.error("Cannot post to notification channel %s (%s); claims stay queued, retrying in %ss",
+                         self.notification_channel_id, e, CLAIM_DELIVERY_RETRY)
+        except Exception as e:
+            CLAIM_DELIVERY_ERRORS.inc()
+            logger.exception("Error delivering claim notifications: %s", e)
+        return 0
+
+async def deliver_pending_claims(bot, notification_channel_id: int) -> int:
+    """Send every unnotified claim event from the claim_events outbox"""
+    # The channel's guild may live on another shard process; a partial
+    # messageable sends through REST without needing it cached
+    channel = bot.get_channel(notification_channel_id) or bot.get_partial_messageable(notification_channel_id)
+    
+    sent = 0
+    while True:
+        rows = await get_unnotified_claim_events(CLAIM_OUTBOX_BATCH)
         
-        await channel.send(embed=discord.Embed.from_dict(embed))
-        print(f"Sent claim notification for token {event['token_mint']}")
+        # Up to 10 embeds per message; each batch is marked in one statement
+        # right after it is sent, so a crash can only repeat that one batch
+        for i in range(0, len(rows), CLAIM_EMBEDS_PER_MESSAGE):
+            events = [
+                claim_event_dict(token_mint, (signature, wallet, is_creator, amount, timestamp))
+                for signature, token_mint, wallet, is_creator, amount, timestamp in rows[i:i + CLAIM_EMBEDS_PER_MESSAGE]
+            ]
+            signatures = [event['signature'] for event in events]
+            try:
+                await channel.send(embeds=[build_claim_embed(event) for event in events])
+            except discord.HTTPException as e:
+                if e.status != 400:
+                    raise
+                # The batch itself is invalid and would block the outbox forever
+                logger.error("Discord rejected claim notification(s) %s, marking them notified: %s", signatures, e)
+                await mark_claim_events_notified(signatures)
+                CLAIMS_REJECTED.inc(len(events))
+                continue
+            await mark_claim_events_notified(signatures)
+            sent += len(events)
+            CLAIMS_DELIVERED.inc(len(events))
         
-    except Exception as e:
-        print(f"Error sending claim notification: {e}")
\ No newline at end of file
+        if len(rows) < CLAIM_OUTBOX_BATCH:
+            if sent:
+                logger.info("Sent %s claim notification(s)", sent)
+            return sent
+
+def build_claim_embed(event: Dict[str, Any]) -> discord.Embed:
+    """Build the notification embed for a claim event"""
+    embed = {
+        "title": "💰 New Fee Claim Detected!",
+        "description": f"Someone claimed fees from a monitored token!",
+        "color": 0x00ff00,
+        "fields": [
+            {
+                "name": "Token Mint",
+                "value": f"`{event['token_mint']}`",
+                "inline": False
+            },
+            {
+                "name": "Claimer Wallet",
+                "value": f"`{event['wallet']}`",
+                "inline": True
+            },
+            {
+                "name": "Is Creator",
+                "value": "Yes" if event['is_creator'] else "No",
+                "inline": True
+            },
+            {
+                "name": "Amount Claimed",
+                "value": f"🪙 {event['amount']} SOL",
+                "inline": True
+            },
+            {
+                "name": "Timestamp",
+                "value": f"<t:{int(time.time())}:R>",  # Discord timestamp
+                "inline": True
+            },
+            {
+                "name": "Transaction",
+                "value": f"[View on Solana Explorer](https://solscan.io/tx/{event['signature']})",
+                "inline": False
+            }
+        ],
+        "footer": {
+            "text": "Bags Fee Claim Monitor"
+        }
+    }
+    
+    return discord.Embed.from_dict(embed)
@@ -1,31 +1,66 @@
 
 import discord
 from discord.ext import commands
+import contextlib
 import logging
 import os
-import asyncio
+import time
 
 # Import our modules
-from database import (
+from async_database import (
     init_connection_pool,
     init_db,
-    get_all_users_monitoring,
-    is_notifications_enabled
+    load_trigger_index,
+    load_notification_preferences
 )
-from commands import setup_commands
-from bags_service import start_monitoring_loop
+from commands import setup_commands, sync_commands
+from bags_service import bags_service, start_monitoring_loop, BAGS_WEBHOOK_PORT
+from webhook_server import start_webhook_server
+from metrics import METRICS_PORT, Gauge, start_metrics_server
+from dm_dispatcher import dm_dispatcher
+from alert_digest import alert_digest
+from message_monitor import handle_message
+from channel_visibility import channel_visibility
+from guild_watchers import guild_watchers
+from trigger_index import trigger_index
+from cache_sync import cache_sync
+from leader import leader_election
+
+# Set up logging; per-message detail is only logged at LOG_LEVEL=DEBUG
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger('bot')
+
+STARTED_AT = time.perf_counter()
+STARTUP_PHASE_SECONDS = Gauge('startup_phase_seconds', 'Time each startup phase took', ['phase'])
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger('discord')
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """Log and record how long one step of startup takes"""
+    started = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - started
+    STARTUP_PHASE_SECONDS.labels(name).set(elapsed)
+    logger.info("Startup: %s took %.2fs", name, elapsed)
 
 # Get configuration from environment variables
 TOKEN = os.environ.get('BOT_TOKEN')
 DATABASE_URL = os.environ.get('DATABASE_URL')
 NOTIFICATION_CHANNEL_ID = os.environ.get('NOTIFICATION_CHANNEL_ID')  # Channel ID for #bot-pings
 
-print("Starting bot...")
-print(f"DATABASE_URL exists: {DATABASE_URL is not None}")
+# Sharding: leave both unset to run every shard Discord recommends in this
+# process; to spread shards over processes give each one the same SHARD_COUNT
+# and its own SHARD_IDS (e.g. "0,1"). Discord's global 50 requests/s is per
+# bot token, so DM_RATE_LIMIT is the budget for all processes together and each
+# one sends at DM_RATE_LIMIT * len(SHARD_IDS) / SHARD_COUNT
+SHARD_COUNT = os.environ.get('SHARD_COUNT')
+SHARD_IDS = os.environ.get('SHARD_IDS')
+
+logger.info("Starting bot...")
+logger.info("DATABASE_URL exists: %s", DATABASE_URL is not None)
 
 if not TOKEN:
     raise ValueError("BOT_TOKEN environment variable not set")
@@ -38,38 +73,155 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-# Create bot instance
-bot = commands.Bot(command_prefix='!', intents=intents)
+class MonitorBot(commands.AutoShardedBot):
+    webhook_runner = None
+    metrics_runner = None
+    ready_once = False
+    
+    async def setup_hook(self):
+        """One-time initialisation; runs after login, before the gateway connects
+
+        on_ready fires again after every reconnect, so nothing here may live there.
+        """
+        with startup_phase("connection pool"):
+            await init_connection_pool()
+        with startup_phase("schema"):
+            await init_db()
+        with startup_phase("caches"):
+            # Listen before loading so changes made meanwhile by other instances apply afterwards
+            await cache_sync.connect()
+            await load_trigger_index()
+            await load_notification_preferences()
+        with startup_phase("slash commands"):
+            setup_commands(self)
+            try:
+                await sync_commands(self)
+            except Exception as e:
+                logger.error("Error syncing commands: %s", e)
+        with startup_phase("background tasks"):
+            cache_sync.start(self)
+            dm_dispatcher.start(self)
+            if METRICS_PORT:
+                self.metrics_runner = await start_metrics_server()
+            # Only the elected leader polls Bags, so replicas don't double-post claims
+            if NOTIFICATION_CHANNEL_ID:
+                leader_election.start(run_claim_monitor)
+            else:
+                logger.warning("NOTIFICATION_CHANNEL_ID not set. Bags monitoring will not start.")
+    
+    async def close(self):
+        """Release long-lived resources before disconnecting"""
+        # Send open digests and queued alerts while the HTTP session is still up
+        alert_digest.flush_all()
+        await dm_dispatcher.drain()
+        if self.webhook_runner:
+            await self.webhook_runner.cleanup()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        await leader_election.stop()
+        await cache_sync.stop()
+        await bags_service.close()
+        await super().close()
+
+# Create bot instance; each shard only receives events for its own guilds, so
+# matching is partitioned across shard processes without any coordination
+shard_options = {}
+if SHARD_COUNT:
+    shard_options['shard_count'] = int(SHARD_COUNT)
+if SHARD_IDS:
+    if not SHARD_COUNT:
+        raise ValueError("SHARD_IDS requires SHARD_COUNT to be set")
+    shard_options['shard_ids'] = [int(shard_id) for shard_id in SHARD_IDS.split(',')]
+bot = MonitorBot(command_prefix='!', intents=intents, **shard_options)
+
+@bot.event
+async def on_shard_ready(shard_id):
+    """Called when a shard connects, and again whenever it alone re-identifies"""
+    # The shard's member caches were rebuilt; that is all that needs redoing.
+    # on_ready only fires again once every shard has re-readied
+    guilds = [guild for guild in bot.guilds if guild.shard_id == shard_id]
+    for guild in guilds:
+        guild_watchers.add_guild(guild)
+    logger.info("Shard %s ready with %s server(s)", shard_id, len(guilds))
 
 @bot.event
 async def on_ready():
-    """Called when the bot successfully connects to Discord"""
-    init_connection_pool()
-    init_db()
-    
-    # Register slash commands
-    setup_commands(bot)
-    
-    # Sync slash commands with Discord
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        print(f"Error syncing commands: {e}")
-    
-    print(f'{bot.user} has connected to Discord!')
-    print(f'Bot ID: {bot.user.id}')
-    print(f'Connected to {len(bot.guilds)} server(s)')
-    for guild in bot.guilds:
-        print(f'  - {guild.name} (ID: {guild.id})')
-    
-    # Start the Bags API monitoring loop
-    if NOTIFICATION_CHANNEL_ID:
-        notification_channel_id = int(NOTIFICATION_CHANNEL_ID)
-        print(f"Starting Bags API monitoring for channel {notification_channel_id}")
-        asyncio.create_task(start_monitoring_loop(bot, notification_channel_id))
+    """Called when every shard has connected to Discord, and again after a full reconnect"""
+    if not bot.ready_once:
+        bot.ready_once = True
+        logger.info("%s has connected to Discord! Ready %.2fs after start", bot.user, time.perf_counter() - STARTED_AT)
+        logger.info("Bot ID: %s", bot.user.id)
     else:
-        print("WARNING: NOTIFICATION_CHANNEL_ID not set. Bags monitoring will not start.")
+        logger.info("Reconnected to Discord")
+    logger.info("Connected to %s server(s) on shard(s) %s of %s", len(bot.guilds), sorted(bot.shards), bot.shard_count)
+    for guild in bot.guilds:
+        logger.debug("  - %s (ID: %s)", guild.name, guild.id)
+
+async def run_claim_monitor():
+    """Leader-only work: the Bags poller, claim outbox delivery and the push endpoint"""
+    notification_channel_id = int(NOTIFICATION_CHANNEL_ID)
+    logger.info("Starting Bags API monitoring for channel %s", notification_channel_id)
+    await bags_service.start()
+    if BAGS_WEBHOOK_PORT and not bot.webhook_runner:
+        bot.webhook_runner = await start_webhook_server()
+    try:
+        await start_monitoring_loop(bot, notification_channel_id)
+    finally:
+        # A new leader takes over the webhook port
+        if bot.webhook_runner:
+            await bot.webhook_runner.cleanup()
+            bot.webhook_runner = None
+
+@bot.event
+async def on_guild_available(guild):
+    """A guild came back after a re-identify; updates missed meanwhile may have changed who sees what"""
+    channel_visibility.invalidate_guild(guild)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    """Channel overwrites may have changed who can see it"""
+    channel_visibility.invalidate_channel(after)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    channel_visibility.invalidate_channel(channel)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    """A role's permissions changed, so every channel in the guild may be affected"""
+    if before.permissions != after.permissions:
+        channel_visibility.invalidate_guild(after.guild)
+
+@bot.event
+async def on_guild_role_delete(role):
+    channel_visibility.invalidate_guild(role.guild)
+
+@bot.event
+async def on_member_join(member):
+    guild_watchers.member_joined(member)
+    # Visible sets only hold watchers; later watchers arrive via guild_watchers.refresh_user
+    if trigger_index.is_watcher(member.id):
+        channel_visibility.update_member(member)
+
+@bot.event
+async def on_member_update(before, after):
+    """Re-check a member whose roles changed"""
+    if before.roles != after.roles and trigger_index.is_watcher(after.id):
+        channel_visibility.update_member(after)
+
+@bot.event
+async def on_raw_member_remove(payload):
+    guild_watchers.member_left(payload.guild_id, payload.user.id)
+    channel_visibility.remove_member(payload.guild_id, payload.user.id)
+
+@bot.event
+async def on_guild_join(guild):
+    guild_watchers.add_guild(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    guild_watchers.remove_guild(guild.id)
+    channel_visibility.invalidate_guild(guild)
 
 @bot.event
 async def on_message(message):
@@ -79,86 +231,17 @@ async def on_message(message):
     if message.author.bot:
         return
     
-    print(f"Message received from {message.author}: {message.content}")
-    
-    # Convert message to lowercase for checking
-    message_lower = message.content.lower()
-    
-    # Extract all words from the message
-    words_in_message = message_lower.split()
-    
-    # Track which users to notify and what words triggered
-    notifications = {}  # {user_id: [list of triggered words]}
-    
-    # Check each word in the message
-    for word in words_in_message:
-        # Clean the word (remove punctuation)
-        clean_word = ''.join(char for char in word if char.isalnum())
-        if not clean_word:
-            continue
-            
-        # Find all users monitoring this word
-        monitoring_users = get_all_users_monitoring(clean_word)
-        
-        for user_id in monitoring_users:
-            # Don't notify the person who sent the message
-            # if user_id == message.author.id:
-            #     continue
-                
-            # Check if they have notifications enabled
-            if not is_notifications_enabled(user_id):
-                continue
-            
-            if user_id not in notifications:
-                notifications[user_id] = []
-            notifications[user_id].append(clean_word)
-    
-    # Send notifications
-    for user_id, triggered_words in notifications.items():
-        try:
-            # Check if the message is in a server (guild)
-            if message.guild:
-                # Check if the user is a member of this server
-                member = message.guild.get_member(user_id)
-                if not member:
-                    print(f"  -> User {user_id} not in server {message.guild.name}, skipping notification")
-                    continue
-                
-                # Check if the user can see the channel where the message was sent
-                channel_permissions = message.channel.permissions_for(member)
-                if not channel_permissions.read_messages:
-                    print(f"  -> User {member.name} cannot see channel {message.channel.name}, skipping notification")
-                    continue
-            
-            user = await bot.fetch_user(user_id)
-            
-            # Create the DM message
-            dm_message = (
-                f"**Alert!**\n\n"
-                # f"**Word(s) detected:** {', '.join(set(triggered_words))}\n"
-                f"**From:** {message.author.name} ({message.author.mention})\n"
-                f"**Server:** {message.guild.name if message.guild else 'DM'}\n"
-                f"**Channel:** {message.channel.mention if hasattr(message.channel, 'mention') else 'DM'}\n"
-                f"**Message:** {message.content[:200]}\n\n"
-                f"[Jump to message]({message.jump_url})"
-            )
-            
-            await user.send(dm_message)
-            print(f"  -> Sent alert to {user.name} for words: {triggered_words}")
-            
-        except discord.Forbidden:
-            print(f"  -> Could not DM user {user_id} (DMs disabled or bot blocked)")
-        except Exception as e:
-            print(f"  -> Error sending DM to {user_id}: {e}")
+    await handle_message(message)
     
     # Allow commands to work
     await bot.process_commands(message)
 
 # Run the bot
-print("\nAttempting to connect to Discord...")
+logger.info("Attempting to connect to Discord...")
 try:
-    bot.run(TOKEN)
+    # Route discord.py's logs through the root configuration above
+    bot.run(TOKEN, log_handler=None)
 except discord.LoginFailure:
-    print("\nERROR: Invalid token. Please check your bot token is correct.")
+    logger.error("Invalid token. Please check your bot token is correct.")
 except Exception as e:
-    print(f"\nERROR: {e}")
\ No newline at end of file
+    logger.exception("Bot stopped: %s", e)
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+import psycopg2
+from async_database import open_listen_connection, load_trigger_index, load_notification_preferences, publish_reload_marker
+from bags_service import bags_service
+from database import INSTANCE_ID
+from guild_watchers import guild_watchers
+from metrics import Counter
+from preferences import notification_preferences
+from trigger_index import trigger_index
+
+logger = logging.getLogger(__name__)
+
+CACHE_SYNC_RETRY = float(os.environ.get('CACHE_SYNC_RETRY', '5'))  # Seconds between reconnect attempts
+
+CHANGES_APPLIED = Counter('cache_changes_applied_total', 'Cache changes applied from other instances')
+CACHE_RELOADS = Counter('cache_reloads_total', 'Full cache reloads after the change listener reconnected')
+
+
+class CacheSync:
+    """Keeps this process's caches in step with changes made by other bot processes
+
+    Writers publish each change with pg_notify in the same transaction; here a
+    dedicated connection LISTENs and applies them one by one. Notifications sent
+    while the listener was disconnected are lost, so every reconnect reloads the
+    caches in full.
+
+    A reload swaps in a snapshot that may predate this instance's own latest
+    writes, whose local updates went to the replaced caches. Until the marker
+    published after the reload echoes back, this instance's own changes are
+    applied like anyone else's (applying one twice is harmless).
+    """
+
+    def __init__(self):
+        self.bot = None
+        self._conn = None
+        self._task = None
+        self._reload_marker = None  # Set from a reload until its marker echoes back
+
+    async def connect(self):
+        """Start LISTENing; call before loading the caches so no change is missed"""
+        if self._conn is None and self._task is None:
+            try:
+                self._conn = await open_listen_connection()
+            except (psycopg2.Error, OSError) as e:
+                logger.warning("Could not listen for cache changes yet: %s", e)
+
+    def start(self, bot):
+        """Apply changes in the background (safe to call more than once)"""
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        conn, self._conn = self._conn, None
+        while True:
+            # Only a connection opened before the initial load needs no reload
+            reload = conn is None
+            try:
+                if conn is None:
+                    conn = await open_listen_connection()
+                await self._listen(conn, reload)
+            except (psycopg2.Error, OSError) as e:
+                logger.warning("Cache change listener disconnected: %s", e)
+            except Exception:
+                logger.exception("Cache change listener failed")
+            conn = None
+            await asyncio.sleep(CACHE_SYNC_RETRY)
+
+    async def _listen(self, conn, reload):
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(conn.fileno(), readable.set)
+        try:
+            # LISTEN is already active, so nothing committed during the reload is missed
+            if reload:
+                await self.reload()
+            logger.info("Listening for cache changes from other instances")
+            while True:
+                await readable.wait()
+                readable.clear()
+                conn.poll()
+                while conn.notifies:
+                    self.apply(conn.notifies.pop(0).payload)
+        finally:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+
+    async def reload(self):
+        """Rebuild every cache from the database"""
+        marker = self._reload_marker = uuid.uuid4().hex
+        await load_trigger_index()
+        await load_notification_preferences()
+        if self.bot:
+            guild_watchers.load(self.bot.guilds)
+        await publish_reload_marker(marker)
+        CACHE_RELOADS.inc()
+        logger.info("Reloaded caches after reconnecting")
+
+    def apply(self, payload):
+        """Apply one published change unless this instance made it"""
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed cache change: %r", payload)
+            return
+        kind = change.get('kind')
+        if kind == 'reload_done':
+            if change.get('marker') == self._reload_marker:
+                self._reload_marker = None
+            return
+        if change.get('instance') == INSTANCE_ID and self._reload_marker is None:
+            return
+
+        if kind == 'triggers_added':
+            for word in change['words']:
+                trigger_index.add(change['user_id'], word, change.get('guild_id'), change.get('channel_id'))
+            self._refresh_watcher(change['user_id'])
+        elif kind == 'trigger_removed':
+            trigger_index.remove(change['user_id'], change['word'])
+            self._refresh_watcher(change['user_id'])
+        elif kind == 'notifications':
+            notification_preferences.set_enabled(change['user_id'], change['enabled'])
+        elif kind == 'digest_window':
+            notification_preferences.set_digest_window(change['user_id'], change['seconds'])
+        elif kind == 'token_added':
+            # Tokens are read from the schedule table each tick; just poll the new one now
+            bags_service.wake()
+        elif kind == 'token_removed':
+            pass  # Nothing cached per token
+        else:
+            logger.warning("Ignoring unknown cache change: %s", kind)
+            return
+
+        CHANGES_APPLIED.inc()
+        logger.debug("Applied cache change %s from instance %s", kind, change.get('instance'))
+
+    def _refresh_watcher(self, user_id):
+        if self.bot:
+            guild_watchers.refresh_user(self.bot, user_id)
+
+# Global instance
+cache_sync = CacheSync()
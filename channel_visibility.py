@@ -0,0 +1,67 @@
+import discord
+
+
+class ChannelVisibility:
+    """Cache of the members who can read each guild channel"""
+
+    def __init__(self):
+        self._visible = {}  # guild_id -> {channel_id: set of member IDs}
+
+        # Statistics
+        self.hits = 0
+        self.builds = 0
+
+    def get_visible_members(self, channel, candidates=None):
+        """Get the IDs of members who can read a channel, computing it once per channel
+
+        `candidates` limits the first computation to a subset of member IDs (the
+        guild's watchers); anyone added later must go through update_member().
+        """
+        # Threads inherit their visibility from the parent channel
+        if isinstance(channel, discord.Thread) and channel.parent is not None:
+            channel = channel.parent
+
+        guild_channels = self._visible.setdefault(channel.guild.id, {})
+        visible = guild_channels.get(channel.id)
+        if visible is not None:
+            self.hits += 1
+            return visible
+
+        self.builds += 1
+        guild = channel.guild
+        if candidates is None:
+            members = guild.members
+        else:
+            members = [member for member in map(guild.get_member, candidates) if member is not None]
+        visible = {member.id for member in members if channel.permissions_for(member).read_messages}
+        guild_channels[channel.id] = visible
+        return visible
+
+    def update_member(self, member):
+        """Re-evaluate one member against the cached channels of their guild"""
+        for channel_id, visible in self._visible.get(member.guild.id, {}).items():
+            channel = member.guild.get_channel(channel_id)
+            if channel is not None and channel.permissions_for(member).read_messages:
+                visible.add(member.id)
+            else:
+                visible.discard(member.id)
+
+    def remove_member(self, guild_id, member_id):
+        """Drop a member who left a guild"""
+        for visible in self._visible.get(guild_id, {}).values():
+            visible.discard(member_id)
+
+    def invalidate_channel(self, channel):
+        """Forget a channel after its permission overwrites changed"""
+        if isinstance(channel, discord.CategoryChannel):
+            # Synced child channels take their overwrites from the category
+            self.invalidate_guild(channel.guild)
+        else:
+            self._visible.get(channel.guild.id, {}).pop(channel.id, None)
+
+    def invalidate_guild(self, guild):
+        """Forget every channel in a guild, e.g. after a role's permissions changed"""
+        self._visible.pop(guild.id, None)
+
+# Global instance
+channel_visibility = ChannelVisibility()
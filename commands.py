@@ -1,23 +1,59 @@
+import hashlib
+import json
+import logging
 import discord
 from discord import app_commands
-from database import (
+from async_database import (
     add_trigger_word,
     remove_trigger_word,
     get_user_triggers,
     toggle_notifications,
+    set_digest_window,
     add_token_monitor,
     remove_token_monitor,
-    get_all_monitored_tokens
+    get_all_monitored_tokens,
+    get_bot_state,
+    set_bot_state
 )
+from database import TriggerLimitError, MAX_TRIGGERS_PER_USER
 from ui import AddMultipleWordsModal
+from user_resolver import user_resolver
+from guild_watchers import guild_watchers
+
+logger = logging.getLogger(__name__)
+
+async def sync_commands(bot):
+    """Push the slash command tree to Discord, skipping the rate-limited call if it is unchanged
+
+    Returns True if a sync was sent.
+    """
+    payload = [command.to_dict() for command in bot.tree.get_commands()]
+    tree_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    key = f'command_tree_hash:{bot.application_id}'
+    if await get_bot_state(key) == tree_hash:
+        logger.info("Slash commands unchanged since the last sync, skipping")
+        return False
+    
+    synced = await bot.tree.sync()
+    await set_bot_state(key, tree_hash)
+    logger.info("Synced %s command(s)", len(synced))
+    return True
 
 def setup_commands(bot):
     """Register all slash commands with the bot"""
 
     # Slash Commands
-    @bot.tree.command(name="watch", description="Add a single word to monitor")
-    @app_commands.describe(word="The word you want to watch for")
-    async def watch_command(interaction: discord.Interaction, word: str):
+    @bot.tree.command(name="watch", description="Add a word or phrase to monitor")
+    @app_commands.describe(
+        word="The word or phrase you want to watch for",
+        scope="Where to watch for it (default: everywhere)"
+    )
+    @app_commands.choices(scope=[
+        app_commands.Choice(name="Everywhere", value="everywhere"),
+        app_commands.Choice(name="This server only", value="server"),
+        app_commands.Choice(name="This channel only", value="channel")
+    ])
+    async def watch_command(interaction: discord.Interaction, word: str, scope: app_commands.Choice[str] = None):
         """Add a word to your monitoring list"""
         
         # Clean the word
@@ -27,14 +63,34 @@ def setup_commands(bot):
             await interaction.response.send_message("Please provide a valid word!", ephemeral=True)
             return
         
-        # Only take first word if multiple provided
-        word = word.split()[0]
+        # Collapse whitespace so phrases like "server down" match consistently
+        word = ' '.join(word.split())
         
-        success = add_trigger_word(interaction.user.id, word)
+        guild_id = channel_id = None
+        where = ""
+        if scope and scope.value != "everywhere":
+            if not interaction.guild:
+                await interaction.response.send_message("Server and channel scopes only work inside a server!", ephemeral=True)
+                return
+            guild_id = interaction.guild_id
+            where = f" in **{interaction.guild.name}**"
+            if scope.value == "channel":
+                channel_id = interaction.channel_id
+                where = f" in <#{channel_id}>"
+        
+        try:
+            success = await add_trigger_word(interaction.user.id, word, guild_id, channel_id)
+        except TriggerLimitError:
+            await interaction.response.send_message(
+                f"You're already watching the maximum of {MAX_TRIGGERS_PER_USER} words. Use `/unwatch` to make room!",
+                ephemeral=True
+            )
+            return
         
         if success:
-            await interaction.response.send_message(f"Now watching for: **{word}**", ephemeral=True)
-            print(f"User {interaction.user.name} added trigger word: {word}")
+            guild_watchers.refresh_user(bot, interaction.user.id)
+            await interaction.response.send_message(f"Now watching for: **{word}**{where}", ephemeral=True)
+            logger.info("User %s added trigger word: %s", interaction.user.name, word)
         else:
             await interaction.response.send_message(f"You're already watching **{word}**", ephemeral=True)
 
@@ -47,17 +103,22 @@ def setup_commands(bot):
 
     ####
     @bot.tree.command(name="unwatch", description="Remove a word from monitoring")
-    @app_commands.describe(word="The word you want to stop watching")
+    @app_commands.describe(word="The word or phrase you want to stop watching")
     async def unwatch_command(interaction: discord.Interaction, word: str):
         """Remove a word from your monitoring list"""
         
-        word = word.strip().lower().split()[0]
+        word = ' '.join(word.lower().split())
         
-        removed = remove_trigger_word(interaction.user.id, word)
+        if not word:
+            await interaction.response.send_message("Please provide a valid word!", ephemeral=True)
+            return
+        
+        removed = await remove_trigger_word(interaction.user.id, word)
         
         if removed:
+            guild_watchers.refresh_user(bot, interaction.user.id)
             await interaction.response.send_message(f"No longer watching: **{word}**", ephemeral=True)
-            print(f"User {interaction.user.name} removed trigger word: {word}")
+            logger.info("User %s removed trigger word: %s", interaction.user.name, word)
         else:
             await interaction.response.send_message(f"You weren't watching **{word}**", ephemeral=True)
 
@@ -67,7 +128,7 @@ def setup_commands(bot):
     async def mywords_command(interaction: discord.Interaction):
         """List all words you're currently monitoring"""
         
-        triggers = get_user_triggers(interaction.user.id)
+        triggers = await get_user_triggers(interaction.user.id)
         
         if triggers:
             word_list = ', '.join(f"**{word}**" for word in triggers)
@@ -86,13 +147,28 @@ def setup_commands(bot):
     async def toggle_command(interaction: discord.Interaction):
         """Toggle notifications on/off"""
         
-        enabled = toggle_notifications(interaction.user.id)
+        enabled = await toggle_notifications(interaction.user.id)
         
         if enabled:
             await interaction.response.send_message("Notifications **enabled**", ephemeral=True)
         else:
             await interaction.response.send_message("Notifications **disabled**", ephemeral=True)
 
+    ####
+    @bot.tree.command(name="digest", description="Batch your alerts into one DM every few minutes")
+    @app_commands.describe(minutes="How many minutes to collect alerts for (0 sends every alert immediately)")
+    async def digest_command(interaction: discord.Interaction, minutes: app_commands.Range[int, 0, 1440]):
+        """Set your alert digest window"""
+        
+        await set_digest_window(interaction.user.id, minutes * 60)
+        
+        if minutes:
+            await interaction.response.send_message(
+                f"Alerts will be collected into one DM every **{minutes}** minute(s)", ephemeral=True
+            )
+        else:
+            await interaction.response.send_message("Digest mode **disabled**, alerts will be sent immediately", ephemeral=True)
+
     ####
 
     @bot.tree.command(name="help", description="Show information about the bot and its commands")
@@ -108,11 +184,12 @@ def setup_commands(bot):
         embed.add_field(
             name="Message Monitoring Commands",
             value=(
-                "`/watch <word>` - Add a single word to monitor\n"
+                "`/watch <word> [scope]` - Add a word or phrase to monitor, everywhere or in one server/channel\n"
                 "`/watch-multiple` - Add multiple words at once\n"
                 "`/unwatch <word>` - Remove a word from monitoring\n"
                 "`/mywords` - List your monitored words\n"
-                "`/toggle` - Enable/disable notifications"
+                "`/toggle` - Enable/disable notifications\n"
+                "`/digest <minutes>` - Batch alerts into one DM per window (0 to turn off)"
             ),
             inline=False
         )
@@ -168,7 +245,7 @@ def setup_commands(bot):
             )
             return
         
-        success = add_token_monitor(token_mint, interaction.user.id)
+        success = await add_token_monitor(token_mint, interaction.user.id)
         
         if success:
             await interaction.response.send_message(
@@ -176,7 +253,7 @@ def setup_commands(bot):
                 f"Notifications will be sent to the designated channel when someone claims fees.",
                 ephemeral=True
             )
-            print(f"User {interaction.user.name} added token monitor: {token_mint}")
+            logger.info("User %s added token monitor: %s", interaction.user.name, token_mint)
         else:
             await interaction.response.send_message(
                 f"⚠️ Token `{token_mint}` is already being monitored.", 
@@ -190,14 +267,14 @@ def setup_commands(bot):
         """Stop monitoring a token for fee claim events"""
         
         token_mint = token_mint.strip()
-        removed = remove_token_monitor(token_mint)
+        removed = await remove_token_monitor(token_mint)
         
         if removed:
             await interaction.response.send_message(
                 f"✅ No longer monitoring token `{token_mint}`.", 
                 ephemeral=True
             )
-            print(f"User {interaction.user.name} removed token monitor: {token_mint}")
+            logger.info("User %s removed token monitor: %s", interaction.user.name, token_mint)
         else:
             await interaction.response.send_message(
                 f"❌ Token `{token_mint}` was not being monitored.", 
@@ -209,7 +286,7 @@ def setup_commands(bot):
     async def list_monitors_command(interaction: discord.Interaction):
         """List all tokens currently being monitored"""
         
-        monitored_tokens = get_all_monitored_tokens()
+        monitored_tokens = await get_all_monitored_tokens()
         
         if monitored_tokens:
             embed = discord.Embed(
@@ -223,7 +300,7 @@ def setup_commands(bot):
                 display_mint = f"`{token_mint[:8]}...{token_mint[-8:]}`"
                 
                 try:
-                    user = await bot.fetch_user(added_by)
+                    user = await user_resolver.get_user(bot, added_by, interaction.guild)
                     added_by_name = user.name
                 except:
                     added_by_name = f"User {added_by}"
@@ -1,8 +1,29 @@
 import psycopg2
-from psycopg2 import pool
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_values
+import json
+import logging
 import os
+import uuid
+from db_pool import BlockingConnectionPool
+from trigger_index import trigger_index
+from preferences import notification_preferences
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))  # Seconds to wait for a free connection
+MAX_TRIGGERS_PER_USER = int(os.environ.get('MAX_TRIGGERS_PER_USER', '200'))
+
+# Cache changes are published on this channel so other bot processes can apply
+# them; each process tags its own changes to skip them when they echo back
+CACHE_CHANGES_CHANNEL = 'monitor_cache_changes'
+INSTANCE_ID = os.environ.get('INSTANCE_ID') or uuid.uuid4().hex
+
+# Advisory lock held by the one instance that polls Bags and posts claims
+LEADER_LOCK_KEY = int(os.environ.get('LEADER_LOCK_KEY', '4721390'))
 
 # Database connection pool
 connection_pool = None
@@ -10,30 +31,85 @@ connection_pool = None
 def init_connection_pool():
     """Initialise the database connection pool"""
     global connection_pool
+    if connection_pool:
+        return  # Already open; never replace a pool that callers may be using
     try:
-        from psycopg2 import pool
-        connection_pool = pool.SimpleConnectionPool(
-            1, 10,
-            DATABASE_URL
+        # Blocking pool: calls arrive from the async_database worker threads
+        connection_pool = BlockingConnectionPool(
+            DB_POOL_MIN, DB_POOL_SIZE,
+            DATABASE_URL,
+            timeout=DB_POOL_TIMEOUT
         )
-        print("Database connection pool created")
+        logger.info("Database connection pool created (min %s, max %s)", DB_POOL_MIN, DB_POOL_SIZE)
 
     except Exception as e:
-        print(f"Error creating connection pool: {e}")
+        logger.error("Error creating connection pool: %s", e)
         raise
 
+def open_dedicated_connection():
+    """Open an autocommit connection outside the pool, for session-long state"""
+    # Keepalives make a silently dropped connection raise instead of going quiet
+    conn = psycopg2.connect(DATABASE_URL, keepalives=1, keepalives_idle=30,
+                            keepalives_interval=10, keepalives_count=3)
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    return conn
+
+def open_listen_connection():
+    """Open a dedicated connection LISTENing for cache changes"""
+    conn = open_dedicated_connection()
+    with conn.cursor() as cursor:
+        cursor.execute(f'LISTEN {CACHE_CHANGES_CHANNEL}')
+    return conn
+
+def try_leader_lock(conn):
+    """Try to take the leader advisory lock; it is held until `conn` closes"""
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', (LEADER_LOCK_KEY,))
+        return cursor.fetchone()[0]
+
+def check_connection(conn):
+    """Round-trip on a dedicated connection, raising if it was lost"""
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+def publish_change(cursor, kind, **data):
+    """Queue a cache change notification; Postgres only delivers it if the transaction commits"""
+    payload = json.dumps({'instance': INSTANCE_ID, 'kind': kind, **data})
+    cursor.execute('SELECT pg_notify(%s, %s)', (CACHE_CHANGES_CHANNEL, payload))
+
+def publish_reload_marker(marker):
+    """Publish a marker after a cache reload
+
+    Notifications arrive in commit order, so once the marker echoes back every
+    change committed while the reload ran has been received too.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        publish_change(cursor, 'reload_done', marker=marker)
+        conn.commit()
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
 def get_db_connection():
-    """Get a connection from the pool"""
+    """Get a connection from the pool, waiting if all connections are in use"""
     if connection_pool:
         return connection_pool.getconn()
     raise Exception("Database connection pool not initialized")
 
 
 def return_db_connection(conn):
-    """Return connection to the pool"""    
+    """Return connection to the pool (broken connections are discarded)"""
     if connection_pool:
         connection_pool.putconn(conn)
 
+def get_pool_stats():
+    """Get in-use/idle counts and wait times for the connection pool"""
+    if connection_pool:
+        return connection_pool.stats()
+    return {}
+
 def init_db():
     """Initialise the database with required tables"""
     conn = get_db_connection()
@@ -48,6 +124,13 @@ def init_db():
             )
         ''')
         
+        # Optional scope: only alert in this guild / channel (NULL = everywhere)
+        cursor.execute('''
+            ALTER TABLE user_triggers
+            ADD COLUMN IF NOT EXISTS guild_id BIGINT,
+            ADD COLUMN IF NOT EXISTS channel_id BIGINT
+        ''')
+        
         # Create table for user settings
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_settings (
@@ -56,6 +139,12 @@ def init_db():
             )
         ''')
         
+        # Seconds to batch alerts into one digest DM (0 = send immediately)
+        cursor.execute('''
+            ALTER TABLE user_settings
+            ADD COLUMN IF NOT EXISTS digest_window INTEGER DEFAULT 0
+        ''')
+        
         # Create index for faster lookups
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_trigger_word 
@@ -72,6 +161,20 @@ def init_db():
             )
         ''')
         
+        # Adaptive polling state: each token has its own interval and next due time
+        cursor.execute('''
+            ALTER TABLE token_monitors
+            ADD COLUMN IF NOT EXISTS poll_interval INTEGER DEFAULT 60,
+            ADD COLUMN IF NOT EXISTS next_check_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS last_claim_at TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS last_seen_signature TEXT
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_token_monitors_next_check_at
+            ON token_monitors(next_check_at)
+        ''')
+        
         # Create table for claim event tracking
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS claim_events (
@@ -97,11 +200,26 @@ def init_db():
             CREATE INDEX IF NOT EXISTS idx_claim_events_timestamp 
             ON claim_events(timestamp)
         ''')
+        
+        # Partial index so draining the notification outbox stays cheap
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_claim_events_unnotified
+            ON claim_events(created_at) WHERE notified = FALSE
+        ''')
+        
+        # Small key/value store for bot bookkeeping, e.g. the synced command tree hash
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bot_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
 
         conn.commit()
-        print("Database tables initialised")
+        logger.info("Database tables initialised")
     except Exception as e:
-        print(f"Error initialising BB {e}")
+        logger.error("Error initialising database: %s", e)
         conn.rollback()
         raise
     finally:
@@ -112,6 +230,43 @@ def init_db():
 #############
 
 
+def load_trigger_index():
+    """Load every (user, word) pair into the in-memory trigger index"""
+    conn = get_db_connection()
+    try:
+        # Server-side cursor streams the rows instead of materialising millions of
+        # tuples at once; sorted so posting lists come out in order
+        cursor = conn.cursor(name='load_trigger_index')
+        cursor.itersize = 50000
+        cursor.execute('SELECT user_id, trigger_word, guild_id, channel_id FROM user_triggers ORDER BY trigger_word, user_id')
+        trigger_index.load(cursor)
+        report = trigger_index.memory_report()
+        logger.info("Loaded %s trigger(s) over %s word(s) into memory, ~%.0f bytes per trigger",
+                    report['triggers'], report['words'], report['bytes_per_trigger'])
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+def load_notification_preferences():
+    """Load the users with notifications disabled into the preference cache"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id, notifications_enabled, digest_window FROM user_settings
+            WHERE notifications_enabled = FALSE OR digest_window > 0
+        ''')
+        rows = cursor.fetchall()
+        notification_preferences.load(
+            (row[0] for row in rows if not row[1]),
+            {row[0]: row[2] for row in rows if row[2]}
+        )
+        logger.info("Loaded %s user(s) with notifications disabled, %s in digest mode",
+                    len(notification_preferences.disabled), len(notification_preferences.digest_windows))
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
 def get_user_triggers(user_id):
     """Get all trigger words for a specific user"""
     conn = get_db_connection()
@@ -136,45 +291,89 @@ def get_all_users_monitoring(word):
         cursor.close()
         return_db_connection(conn)
 
-def add_trigger_word(user_id, word):
-    """Add a trigger word for a user"""
+class TriggerLimitError(Exception):
+    """Raised when a user already watches MAX_TRIGGERS_PER_USER words"""
+
+
+def add_trigger_word(user_id, word, guild_id=None, channel_id=None):
+    """Add a trigger word for a user, optionally limited to one guild or channel"""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        try:
-            cursor.execute('INSERT INTO user_triggers (user_id, trigger_word) VALUES (%s, %s)',
+        cursor.execute('''
+            INSERT INTO user_triggers (user_id, trigger_word, guild_id, channel_id)
+            SELECT %s, %s, %s, %s
+            WHERE (SELECT count(*) FROM user_triggers WHERE user_id = %s) < %s
+            ON CONFLICT DO NOTHING
+            RETURNING trigger_word
+        ''', (user_id, word.lower(), guild_id, channel_id, user_id, MAX_TRIGGERS_PER_USER))
+        added = cursor.fetchone() is not None
+        
+        if not added:
+            # Either a duplicate or the user is at the cap; tell them which
+            cursor.execute('SELECT 1 FROM user_triggers WHERE user_id = %s AND trigger_word = %s',
                           (user_id, word.lower()))
-            conn.commit()
-            return True
-        except psycopg2.IntegrityError:
-            conn.rollback()
-            return False  # Word already exists
+            if cursor.fetchone() is None:
+                raise TriggerLimitError(f"User {user_id} is already watching {MAX_TRIGGERS_PER_USER} words")
+        else:
+            publish_change(cursor, 'triggers_added', user_id=user_id, words=[word.lower()],
+                           guild_id=guild_id, channel_id=channel_id)
+        
+        conn.commit()
+        if added:
+            trigger_index.add(user_id, word.lower(), guild_id, channel_id)
+        return added  # False if the word already exists
     finally:
         cursor.close()
         return_db_connection(conn)
 
 def add_multiple_trigger_words(user_id, words):
-    """Add multiple trigger words for a user"""
+    """Add multiple trigger words for a user in one statement
+
+    Returns (added, duplicates, over_limit); words that would take the user past
+    MAX_TRIGGERS_PER_USER are not added.
+    """
+    words = list(dict.fromkeys(word.strip().lower() for word in words if word.strip()))
+    if not words:
+        return [], [], []
+    
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        added = []
-        duplicates = []
-        
-        for word in words:
-            word = word.strip().lower()
-            if not word:
-                continue
-            try:
-                cursor.execute('INSERT INTO user_triggers (user_id, trigger_word) VALUES (%s, %s)',
-                              (user_id, word))
-                added.append(word)
-            except psycopg2.IntegrityError:
-                duplicates.append(word)
-                conn.rollback()
+        cursor.execute('''
+            WITH input AS (
+                SELECT word, ord FROM unnest(%(words)s::text[]) WITH ORDINALITY AS t(word, ord)
+            ),
+            existing AS (
+                SELECT trigger_word FROM user_triggers WHERE user_id = %(user_id)s
+            ),
+            inserted AS (
+                INSERT INTO user_triggers (user_id, trigger_word)
+                SELECT %(user_id)s, word FROM input
+                WHERE word NOT IN (SELECT trigger_word FROM existing)
+                ORDER BY ord
+                LIMIT GREATEST(%(cap)s - (SELECT count(*) FROM existing), 0)
+                ON CONFLICT DO NOTHING
+                RETURNING trigger_word
+            )
+            SELECT word,
+                   word IN (SELECT trigger_word FROM inserted),
+                   word IN (SELECT trigger_word FROM existing)
+            FROM input
+            ORDER BY ord
+        ''', {'words': words, 'user_id': user_id, 'cap': MAX_TRIGGERS_PER_USER})
+        rows = cursor.fetchall()
         
+        added = [word for word, was_added, existed in rows if was_added]
+        duplicates = [word for word, was_added, existed in rows if existed]
+        over_limit = [word for word, was_added, existed in rows if not was_added and not existed]
+        if added:
+            publish_change(cursor, 'triggers_added', user_id=user_id, words=added)
         conn.commit()
-        return added, duplicates
+        
+        for word in added:
+            trigger_index.add(user_id, word)
+        return added, duplicates, over_limit
     finally:
         cursor.close()
         return_db_connection(conn)
@@ -188,7 +387,11 @@ def remove_trigger_word(user_id, word):
         cursor.execute('DELETE FROM user_triggers WHERE user_id = %s AND trigger_word = %s',
                       (user_id, word.lower()))
         removed = cursor.rowcount > 0
+        if removed:
+            publish_change(cursor, 'trigger_removed', user_id=user_id, word=word.lower())
         conn.commit()
+        if removed:
+            trigger_index.remove(user_id, word.lower())
         return removed
     finally:
         cursor.close()
@@ -225,12 +428,30 @@ def toggle_notifications(user_id):
             cursor.execute('INSERT INTO user_settings (user_id, notifications_enabled) VALUES (%s, %s)',
                           (user_id, new_state))
         
+        publish_change(cursor, 'notifications', user_id=user_id, enabled=new_state)
         conn.commit()
+        notification_preferences.set_enabled(user_id, new_state)
         return new_state
     finally:
         cursor.close()
         return_db_connection(conn)
 
+def set_digest_window(user_id, seconds):
+    """Set how long to batch a user's alerts into one digest DM (0 turns digests off)"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO user_settings (user_id, digest_window) VALUES (%s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET digest_window = EXCLUDED.digest_window
+        ''', (user_id, seconds))
+        publish_change(cursor, 'digest_window', user_id=user_id, seconds=seconds)
+        conn.commit()
+        notification_preferences.set_digest_window(user_id, seconds)
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
 
 #############
 # Token Monitoring Functions
@@ -246,6 +467,8 @@ def add_token_monitor(token_mint, user_id):
             ON CONFLICT (token_mint) DO NOTHING
         ''', (token_mint, user_id))
         success = cursor.rowcount > 0
+        if success:
+            publish_change(cursor, 'token_added', token_mint=token_mint)
         conn.commit()
         return success
     finally:
@@ -263,6 +486,8 @@ def remove_token_monitor(token_mint):
         # Also clean up related claim events
         cursor.execute('DELETE FROM claim_events WHERE token_mint = %s', (token_mint,))
         
+        if removed:
+            publish_change(cursor, 'token_removed', token_mint=token_mint)
         conn.commit()
         return removed
     finally:
@@ -291,6 +516,46 @@ def update_last_checked(token_mint):
         cursor.close()
         return_db_connection(conn)
 
+def get_poll_schedule(due_only=True):
+    """Get (token_mint, poll_interval, last_seen_signature) for tokens that are due, or for every token"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        if due_only:
+            cursor.execute('''
+                SELECT token_mint, poll_interval, last_seen_signature FROM token_monitors
+                WHERE next_check_at <= CURRENT_TIMESTAMP
+                ORDER BY next_check_at
+            ''')
+        else:
+            cursor.execute('SELECT token_mint, poll_interval, last_seen_signature FROM token_monitors ORDER BY next_check_at')
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+def _schedule_next_poll(cursor, token_mint, poll_interval, had_claims, last_seen_signature):
+    cursor.execute('''
+        UPDATE token_monitors
+        SET last_checked = CURRENT_TIMESTAMP,
+            poll_interval = %s,
+            next_check_at = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            last_claim_at = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE last_claim_at END,
+            last_seen_signature = COALESCE(%s, last_seen_signature)
+        WHERE token_mint = %s
+    ''', (poll_interval, poll_interval, had_claims, last_seen_signature, token_mint))
+
+def update_poll_schedule(token_mint, poll_interval, had_claims, last_seen_signature=None):
+    """Record a poll, move the token's cursor and schedule its next poll `poll_interval` seconds from now"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        _schedule_next_poll(cursor, token_mint, poll_interval, had_claims, last_seen_signature)
+        conn.commit()
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
 def add_claim_event(signature, token_mint, wallet, is_creator, amount, timestamp):
     """Add a new claim event to track"""
     conn = get_db_connection()
@@ -308,8 +573,42 @@ def add_claim_event(signature, token_mint, wallet, is_creator, amount, timestamp
         cursor.close()
         return_db_connection(conn)
 
-def get_unnotified_claim_events():
-    """Get all claim events that haven't been notified yet"""
+def ingest_claim_events(token_mint, events, poll_intervals=None, last_seen_signature=None):
+    """Insert a page of claim events in one statement and return the ones that were new
+
+    `events` are (signature, wallet, is_creator, amount, timestamp) tuples. When
+    `poll_intervals` is given as (interval_if_new_claims, interval_if_quiet), the
+    token's poll schedule and cursor are updated in the same transaction.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        new_events = []
+        if events:
+            rows = execute_values(cursor, '''
+                INSERT INTO claim_events (signature, token_mint, wallet, is_creator, amount, timestamp)
+                VALUES %s
+                ON CONFLICT (signature) DO NOTHING
+                RETURNING signature
+            ''', [(signature, token_mint, wallet, is_creator, amount, timestamp)
+                  for signature, wallet, is_creator, amount, timestamp in events],
+                page_size=len(events), fetch=True)
+            inserted = {row[0] for row in rows}
+            new_events = [event for event in events if event[0] in inserted]
+        
+        if poll_intervals:
+            had_claims = bool(new_events)
+            poll_interval = poll_intervals[0] if had_claims else poll_intervals[1]
+            _schedule_next_poll(cursor, token_mint, poll_interval, had_claims, last_seen_signature)
+        
+        conn.commit()
+        return new_events
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+def get_unnotified_claim_events(limit=None):
+    """Get the oldest claim events that haven't been notified yet (all of them if no limit)"""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
@@ -318,7 +617,8 @@ def get_unnotified_claim_events():
             FROM claim_events 
             WHERE notified = FALSE 
             ORDER BY created_at
-        ''')
+            LIMIT %s
+        ''', (limit,))
         return cursor.fetchall()
     finally:
         cursor.close()
@@ -331,6 +631,47 @@ def mark_claim_event_notified(signature):
         cursor = conn.cursor()
         cursor.execute('UPDATE claim_events SET notified = TRUE WHERE signature = %s', (signature,))
         conn.commit()
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+def mark_claim_events_notified(signatures):
+    """Mark a batch of claim events as notified in one statement"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE claim_events SET notified = TRUE WHERE signature = ANY(%s)', (list(signatures),))
+        conn.commit()
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+
+#############
+# Bot State Functions
+
+def get_bot_state(key):
+    """Get a stored bookkeeping value, or None if it was never set"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT value FROM bot_state WHERE key = %s', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+def set_bot_state(key, value):
+    """Store a bookkeeping value, replacing any previous one"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO bot_state (key, value) VALUES (%s, %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
+        ''', (key, value))
+        conn.commit()
     finally:
         cursor.close()
         return_db_connection(conn)
\ No newline at end of file
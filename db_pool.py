@@ -0,0 +1,159 @@
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class BlockingConnectionPool:
+    """Thread-safe connection pool that waits for a free connection instead of failing"""
+
+    def __init__(self, minconn, maxconn, dsn, timeout=30.0, check_after=30.0):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.dsn = dsn
+        self.timeout = timeout          # Seconds getconn() waits before giving up
+        self.check_after = check_after  # Ping connections idle for longer than this
+
+        self._cond = threading.Condition()
+        self._idle = []                 # [(conn, returned_at)]
+        self._in_use = 0
+        self._size = 0                  # Open connections, idle or in use
+        self._closed = False
+
+        # Statistics
+        self.checkouts = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.recycled = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn)
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to `timeout` if the pool is exhausted"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn = None
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reserve a slot and open the connection outside the lock
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolError(f"timed out after {self.timeout}s waiting for a database connection")
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - started
+            self.checkouts += 1
+            if waited > 0.001:
+                self.waits += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn, returned_at):
+                self._close_quietly(conn)
+                with self._cond:
+                    self.recycled += 1
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection, discarding it if it is broken"""
+        broken = close or conn.closed
+        if not broken:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                broken = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                # Don't hand the next caller a connection mid-transaction
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            if broken or self._closed:
+                self._size -= 1
+                if broken:
+                    self.recycled += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if broken or self._closed:
+            self._close_quietly(conn)
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Snapshot of pool usage and wait times"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'max': self.maxconn,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'avg_wait_ms': (self.total_wait / self.waits * 1000) if self.waits else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'timeouts': self.timeouts,
+                'recycled': self.recycled,
+            }
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        # Idle for a while: the server or a proxy may have dropped it
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
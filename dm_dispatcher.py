@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import time
+import discord
+from metrics import Counter, Gauge, Histogram
+from rate_limit import TokenBucket, parse_retry_after
+from user_resolver import user_resolver
+
+DM_WORKERS = int(os.environ.get('DM_WORKERS', '5'))
+DM_QUEUE_SIZE = int(os.environ.get('DM_QUEUE_SIZE', '10000'))
+DM_RATE_LIMIT = float(os.environ.get('DM_RATE_LIMIT', '40'))  # DMs per second for the whole bot, below Discord's global 50/s
+DM_MAX_RETRIES = int(os.environ.get('DM_MAX_RETRIES', '3'))
+DM_DRAIN_TIMEOUT = float(os.environ.get('DM_DRAIN_TIMEOUT', '10'))  # Seconds to finish queued DMs on shutdown
+
+logger = logging.getLogger(__name__)
+
+DM_QUEUE_DEPTH = Gauge('dm_queue_depth', 'Alert DMs waiting for a dispatch worker')
+DM_SEND_SECONDS = Histogram('dm_send_seconds', 'Time to resolve a DM channel and send one alert')
+DM_SENT = Counter('dm_sent_total', 'Alert DMs delivered')
+DM_FAILED = Counter('dm_failed_total', 'Alert DMs that could not be delivered')
+DM_DROPPED = Counter('dm_dropped_total', 'Alert DMs dropped because the queue was full')
+DM_RETRIES = Counter('dm_retries_total', 'Alert DM attempts retried after a 429 or 5xx')
+
+
+def process_rate_share(rate):
+    """This process's part of a per-token rate when shards are spread over processes
+
+    Discord's global limit counts every request made with the bot token, so
+    each process gets the share of its shards (SHARD_IDS out of SHARD_COUNT).
+    """
+    shard_count = os.environ.get('SHARD_COUNT')
+    shard_ids = os.environ.get('SHARD_IDS')
+    if not (shard_count and shard_ids):
+        return rate  # One process runs every shard
+    return rate * len(shard_ids.split(',')) / int(shard_count)
+
+
+def get_retry_after(error, attempt):
+    """Seconds to wait after a rate-limited or failed request"""
+    response = getattr(error, 'response', None)
+    return parse_retry_after(response.headers.get('Retry-After') if response is not None else None, attempt)
+
+
+class DMDispatcher:
+    """Queue of alert DMs sent concurrently by a bounded set of workers"""
+
+    def __init__(self, workers=DM_WORKERS, queue_size=DM_QUEUE_SIZE, rate=process_rate_share(DM_RATE_LIMIT)):
+        self.bot = None
+        self.worker_count = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.rate_limiter = TokenBucket(rate, name='discord_dm')
+        self._workers = []
+
+        # Statistics
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+
+    def start(self, bot):
+        """Start the worker tasks (safe to call more than once)"""
+        self.bot = bot
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info("Started %s DM dispatch worker(s)", self.worker_count)
+
+    async def stop(self):
+        """Cancel the worker tasks, dropping anything still queued"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def drain(self, timeout=DM_DRAIN_TIMEOUT):
+        """Give queued DMs up to `timeout` seconds to go out, then stop the workers"""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Shutting down with %s DM(s) still queued", self.queue.qsize())
+        await self.stop()
+
+    def enqueue(self, user_id, content, guild=None):
+        """Queue a DM without waiting for it to be sent"""
+        try:
+            self.queue.put_nowait((user_id, content, guild))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            DM_DROPPED.inc()
+            logger.warning("DM queue full, dropping alert for %s", user_id)
+            return False
+
+    async def _worker(self):
+        while True:
+            user_id, content, guild = await self.queue.get()
+            try:
+                await self._send(user_id, content, guild)
+            except Exception as e:
+                self.failed += 1
+                DM_FAILED.inc()
+                logger.error("Error sending DM to %s: %s", user_id, e)
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, user_id, content, guild):
+        # Per-route buckets are tracked by discord.py's HTTP client; the token
+        # bucket keeps all workers together under the global DM budget
+        for attempt in range(DM_MAX_RETRIES + 1):
+            await self.rate_limiter.acquire()
+            try:
+                started = time.perf_counter()
+                channel = await user_resolver.get_dm_channel(self.bot, user_id, guild)
+                await channel.send(content)
+                DM_SEND_SECONDS.observe(time.perf_counter() - started)
+                self.sent += 1
+                DM_SENT.inc()
+                logger.debug("Sent alert to %s", user_id)
+                return
+            except discord.NotFound:
+                # Stale cached DM channel; resolve it again on the next attempt
+                user_resolver.forget(user_id)
+                if attempt < DM_MAX_RETRIES:
+                    continue
+                raise
+            except discord.Forbidden:
+                self.failed += 1
+                DM_FAILED.inc()
+                logger.info("Could not DM user %s (DMs disabled or bot blocked)", user_id)
+                return
+            except discord.HTTPException as e:
+                if (e.status == 429 or e.status >= 500) and attempt < DM_MAX_RETRIES:
+                    retry_after = get_retry_after(e, attempt)
+                    if e.status == 429:
+                        self.rate_limiter.pause(retry_after)
+                    self.retries += 1
+                    DM_RETRIES.inc()
+                    logger.warning("DM to %s failed with %s, retrying in %.1fs", user_id, e.status, retry_after)
+                    await asyncio.sleep(retry_after)
+                    continue
+                raise
+
+# Global instance
+dm_dispatcher = DMDispatcher()
+DM_QUEUE_DEPTH.set_function(dm_dispatcher.queue.qsize)
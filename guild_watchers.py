@@ -0,0 +1,53 @@
+from trigger_index import trigger_index
+from channel_visibility import channel_visibility
+
+
+class GuildWatchers:
+    """Index of guild -> members who watch at least one word"""
+
+    def __init__(self):
+        self.guilds = {}  # guild_id -> set of user IDs
+
+    def load(self, guilds):
+        """Build the index from the member caches of every guild the bot is in"""
+        self.guilds = {
+            guild.id: {member.id for member in guild.members if trigger_index.is_watcher(member.id)}
+            for guild in guilds
+        }
+        # Cached visible sets only cover the watchers known when they were built
+        for guild in guilds:
+            channel_visibility.invalidate_guild(guild)
+
+    def get(self, guild_id):
+        """Get the watchers who are members of a guild"""
+        return self.guilds.get(guild_id, set())
+
+    def add_guild(self, guild):
+        self.guilds[guild.id] = {member.id for member in guild.members if trigger_index.is_watcher(member.id)}
+        channel_visibility.invalidate_guild(guild)
+
+    def remove_guild(self, guild_id):
+        self.guilds.pop(guild_id, None)
+
+    def member_joined(self, member):
+        if trigger_index.is_watcher(member.id):
+            self.guilds.setdefault(member.guild.id, set()).add(member.id)
+
+    def member_left(self, guild_id, user_id):
+        self.guilds.get(guild_id, set()).discard(user_id)
+
+    def refresh_user(self, bot, user_id):
+        """Re-check a user after their trigger list changed"""
+        watching = trigger_index.is_watcher(user_id)
+        for guild in bot.guilds:
+            members = self.guilds.setdefault(guild.id, set())
+            member = guild.get_member(user_id) if watching else None
+            if member is None:
+                members.discard(user_id)
+            elif user_id not in members:
+                members.add(user_id)
+                # New watcher: add them to any cached channel visibility sets
+                channel_visibility.update_member(member)
+
+# Global instance
+guild_watchers = GuildWatchers()
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+from async_database import open_dedicated_connection, try_leader_lock, check_connection
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+LEADER_RETRY = float(os.environ.get('LEADER_RETRY', '15'))  # Seconds between attempts to take the lock
+LEADER_CHECK = float(os.environ.get('LEADER_CHECK', '10'))  # Seconds between checks that we still hold it
+
+IS_LEADER = Gauge('leader', '1 while this instance holds the leader lock')
+IS_LEADER.set(0)
+
+
+class LeaderElection:
+    """Runs a task on exactly one instance, chosen with a Postgres advisory lock
+
+    The lock lives on a dedicated session, so it is released as soon as the
+    holder's connection closes or dies; a standby then takes it over on its next
+    attempt. The leader task is cancelled the moment the session is found lost.
+    """
+
+    def __init__(self):
+        self.is_leader = False
+        self._task = None
+
+    def start(self, lead):
+        """Compete for leadership in the background, running `lead()` while leader
+
+        Safe to call more than once; only the first call starts the election.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(lead))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, lead):
+        while True:
+            conn = None
+            try:
+                conn = await open_dedicated_connection()
+                while not await try_leader_lock(conn):
+                    await asyncio.sleep(LEADER_RETRY)
+                await self._lead(conn, lead)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Leader election interrupted: %s", e)
+            finally:
+                if conn is not None:
+                    conn.close()  # Releases the lock if we still held it
+            await asyncio.sleep(LEADER_RETRY)
+
+    async def _lead(self, conn, lead):
+        logger.info("Became leader, starting leader-only tasks")
+        self.is_leader = True
+        IS_LEADER.set(1)
+        leading = asyncio.create_task(lead())
+        try:
+            while True:
+                done, _ = await asyncio.wait({leading}, timeout=LEADER_CHECK)
+                if done:
+                    leading.result()
+                    return
+                # A lost session means another instance may already lead
+                await check_connection(conn)
+        finally:
+            leading.cancel()
+            await asyncio.gather(leading, return_exceptions=True)
+            self.is_leader = False
+            IS_LEADER.set(0)
+            logger.info("Gave up leadership")
+
+# Global instance
+leader_election = LeaderElection()
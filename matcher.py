@@ -0,0 +1,307 @@
+import re
+import sys
+from array import array
+from itertools import filterfalse
+
+# Runs of alphanumeric characters, the same boundaries the whole-word check uses
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+# Trie edges are keyed by (node << CHAR_BITS | ord(char)) so the whole
+# automaton lives in one dict plus a few flat arrays
+CHAR_BITS = 21
+
+# Patterns added since the automaton was built are found with plain substring
+# searches; past this many (or once removals dominate) it should be rebuilt
+MAX_PENDING = 256
+
+
+def first_token(pattern):
+    """Leading alphanumeric run of a pattern, or None if it has none"""
+    found = TOKEN_RE.search(pattern)
+    return found.group() if found else None
+
+
+def joined_words(text):
+    """Punctuation-stripped forms of the words in text that have punctuation inside
+
+    Triggers have always matched "don't" and "e-mail" as "dont" and "email",
+    which tokenising on punctuation alone would miss.
+    """
+    joined = []
+    for word in filterfalse(str.isalnum, text.split()):
+        runs = TOKEN_RE.findall(word)
+        if len(runs) > 1:
+            joined.append(''.join(runs))
+    return joined
+
+
+def _on_boundary(text, text_len, start, end):
+    """Check that text[start:end] is not part of a longer word"""
+    if start > 0 and text[start - 1].isalnum() and text[start].isalnum():
+        return False
+    if end < text_len and text[end].isalnum() and text[end - 1].isalnum():
+        return False
+    return True
+
+
+def _occurs_as_words(text, pattern):
+    """Check that pattern appears in text on word boundaries at least once"""
+    text_len = len(text)
+    start = text.find(pattern)
+    while start != -1:
+        if _on_boundary(text, text_len, start, start + len(pattern)):
+            return True
+        start = text.find(pattern, start + 1)
+    return False
+
+
+class PhraseMatcher:
+    """Finds whole-word patterns, including multi-word phrases, by their first token
+
+    A whole-word hit always starts with one of the text's alphanumeric tokens,
+    so the text is tokenised with one regex call and intersected with the
+    patterns' first tokens. Only patterns that are more than a bare token
+    ("server down", "c++") are then confirmed with a substring search. Adding
+    or removing a pattern is a single dict update; nothing is ever rebuilt.
+    """
+
+    def __init__(self, patterns=()):
+        self._by_token = {}        # first token -> pattern, or tuple of patterns sharing it
+        self._untokenised = set()  # Patterns without any alphanumeric run, matched as substrings
+        self._patterns = 0
+
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __len__(self):
+        return self._patterns
+
+    def add(self, pattern):
+        token = first_token(pattern)
+        if token is None:
+            if pattern and pattern not in self._untokenised:
+                self._untokenised.add(pattern)
+                self._patterns += 1
+            return
+
+        # Most patterns are a bare token; reuse the pattern string as the key
+        token = pattern if token == pattern else sys.intern(token)
+        entry = self._by_token.get(token)
+        if entry is None:
+            self._by_token[token] = pattern
+        elif isinstance(entry, str):
+            if entry == pattern:
+                return
+            self._by_token[token] = (entry, pattern)
+        elif pattern in entry:
+            return
+        else:
+            self._by_token[token] = entry + (pattern,)
+        self._patterns += 1
+
+    def remove(self, pattern):
+        token = first_token(pattern)
+        if token is None:
+            if pattern in self._untokenised:
+                self._untokenised.discard(pattern)
+                self._patterns -= 1
+            return
+
+        entry = self._by_token.get(token)
+        if entry is None:
+            return
+        if isinstance(entry, str):
+            if entry != pattern:
+                return
+            del self._by_token[token]
+        else:
+            if pattern not in entry:
+                return
+            rest = tuple(other for other in entry if other != pattern)
+            self._by_token[token] = rest[0] if len(rest) == 1 else rest
+        self._patterns -= 1
+
+    def tokens(self):
+        """Set-like view of every pattern's first token"""
+        return self._by_token.keys()
+
+    def untokenised(self):
+        """Patterns with no alphanumeric token, which only a substring search can find"""
+        return self._untokenised
+
+    def find(self, text):
+        """Return every pattern occurring in text on word boundaries"""
+        found = set()
+        by_token = self._by_token
+        for token in by_token.keys() & TOKEN_RE.findall(text):
+            entry = by_token[token]
+            for pattern in ((entry,) if isinstance(entry, str) else entry):
+                if pattern == token or _occurs_as_words(text, pattern):
+                    found.add(pattern)
+        for word in joined_words(text):
+            entry = by_token.get(word)
+            if entry is not None and (entry == word if isinstance(entry, str) else word in entry):
+                found.add(word)
+        for pattern in self._untokenised:
+            if pattern in text:
+                found.add(pattern)
+        return found
+
+    def memory_usage(self):
+        """Approximate bytes held on top of the pattern strings themselves"""
+        return (
+            sys.getsizeof(self._by_token)
+            + sum(sys.getsizeof(token) for token, entry in self._by_token.items()
+                  if isinstance(entry, tuple) or entry != token)
+            + sum(sys.getsizeof(entry) for entry in self._by_token.values() if isinstance(entry, tuple))
+            + sys.getsizeof(self._untokenised)
+        )
+
+
+class AhoCorasick:
+    """Multi-pattern matcher that finds every pattern in a text in one pass
+
+    The automaton is built once. Patterns added afterwards are kept aside and
+    found with substring searches, and removed ones are filtered from the
+    results, until the owner builds a replacement (see `needs_rebuild`).
+    """
+
+    def __init__(self, patterns=()):
+        self._goto = {}
+        self._parent = array('l', [0])
+        self._char = array('l', [0])
+        self._depth = array('l', [0])
+        self._fail = array('l', [0])
+        self._link = array('l', [-1])  # Nearest suffix node that ends a pattern
+        self._out = [None]             # Pattern ending at each node
+        self._built = 0
+        self._pending = set()          # Added since the build
+        self._removed = set()          # Built in, but no longer reported
+
+        for pattern in patterns:
+            self._insert(pattern)
+        self._build()
+
+    def __len__(self):
+        return self._built - len(self._removed) + len(self._pending)
+
+    def add(self, pattern):
+        if not pattern:
+            return
+        if pattern in self._removed:
+            self._removed.discard(pattern)
+        elif not self._is_built(pattern):
+            self._pending.add(pattern)
+
+    def remove(self, pattern):
+        if pattern in self._pending:
+            self._pending.discard(pattern)
+        elif self._is_built(pattern):
+            self._removed.add(pattern)
+
+    def needs_rebuild(self):
+        """Whether enough has changed since the build to be worth building a new automaton"""
+        return len(self._pending) > MAX_PENDING or len(self._removed) > self._built // 2 > 0
+
+    def find(self, text):
+        """Return every pattern occurring anywhere in text"""
+        goto_get = self._goto.get
+        fail = self._fail
+        link = self._link
+        out = self._out
+        found = set()
+        node = 0
+
+        for char in text:
+            code = ord(char)
+            while True:
+                nxt = goto_get(node << CHAR_BITS | code)
+                if nxt is not None:
+                    node = nxt
+                    break
+                if not node:
+                    break
+                node = fail[node]
+
+            hit = node if out[node] is not None else link[node]
+            while hit != -1:
+                found.add(out[hit])
+                hit = link[hit]
+
+        if self._removed:
+            found -= self._removed
+        for pattern in self._pending:
+            if pattern in text:
+                found.add(pattern)
+        return found
+
+    def memory_usage(self):
+        """Approximate bytes held by the automaton"""
+        return (
+            sys.getsizeof(self._goto)
+            + sum(map(sys.getsizeof, self._goto))
+            + sum(map(sys.getsizeof, self._goto.values()))
+            + sum(sys.getsizeof(column) for column in (self._parent, self._char, self._depth, self._fail, self._link))
+            + sys.getsizeof(self._out)
+            + sys.getsizeof(self._pending)
+            + sys.getsizeof(self._removed)
+        )
+
+    def _insert(self, pattern):
+        """Add a pattern to the trie, creating nodes only for its new suffix"""
+        if not pattern:
+            return
+        goto = self._goto
+        node = 0
+        for char in pattern:
+            code = ord(char)
+            key = node << CHAR_BITS | code
+            child = goto.get(key)
+            if child is None:
+                child = len(self._out)
+                goto[key] = child
+                self._parent.append(node)
+                self._char.append(code)
+                self._depth.append(self._depth[node] + 1)
+                self._fail.append(0)
+                self._link.append(-1)
+                self._out.append(None)
+            node = child
+        if self._out[node] is None:
+            self._out[node] = pattern
+            self._built += 1
+
+    def _build(self):
+        """Compute failure and output links over the whole trie"""
+        goto = self._goto
+        parent = self._parent
+        char = self._char
+        fail = self._fail
+        link = self._link
+        out = self._out
+
+        # Parents must be linked before their children, so walk by depth
+        for node in sorted(range(1, len(out)), key=self._depth.__getitem__):
+            up = parent[node]
+            target = 0
+            if up:
+                code = char[node]
+                state = fail[up]
+                while True:
+                    nxt = goto.get(state << CHAR_BITS | code)
+                    if nxt is not None:
+                        target = nxt
+                        break
+                    if not state:
+                        break
+                    state = fail[state]
+            fail[node] = target
+            link[node] = target if out[target] is not None else link[target]
+
+    def _is_built(self, pattern):
+        node = 0
+        for char in pattern:
+            node = self._goto.get(node << CHAR_BITS | ord(char))
+            if node is None:
+                return False
+        return self._out[node] is not None
@@ -0,0 +1,111 @@
+import logging
+import time
+from metrics import Counter, Histogram
+from trigger_index import trigger_index
+from preferences import notification_preferences
+from dm_dispatcher import dm_dispatcher
+from alert_digest import alert_digest
+from channel_visibility import channel_visibility
+from guild_watchers import guild_watchers
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_SECONDS = Histogram('on_message_seconds', 'Time to match one message and queue its alerts')
+MESSAGES_ALERTED = Counter('messages_alerted_total', 'Messages that produced at least one alert')
+PREFILTER_CHECKED = Counter('trigger_prefilter_checked_total', 'Messages checked by the trigger pre-filter')
+PREFILTER_REJECTED = Counter('trigger_prefilter_rejected_total', 'Messages the pre-filter ruled out without a scan')
+PREFILTER_CHECKED.set_function(lambda: trigger_index.checked)
+PREFILTER_REJECTED.set_function(lambda: trigger_index.rejected)
+
+
+async def handle_message(message):
+    """Match a user message against every trigger and queue the resulting alerts
+
+    Kept apart from the bot so the pipeline can be driven without a gateway
+    connection; returns the number of users alerted or added to a digest.
+    """
+    started = time.perf_counter()
+    try:
+        alerted = await _match_and_queue(message)
+    finally:
+        MESSAGE_SECONDS.observe(time.perf_counter() - started)
+    if alerted:
+        MESSAGES_ALERTED.inc()
+    return alerted
+
+
+async def _match_and_queue(message):
+    # Most messages mention no trigger at all; drop them after one regex scan
+    if not trigger_index.might_match(message.content):
+        return 0
+    
+    logger.debug("Message received from %s: %s", message.author, message.content)
+    
+    # Only match against triggers of members of this server; skip the scan
+    # entirely if none of its members watch anything
+    watchers = None
+    if message.guild:
+        watchers = guild_watchers.get(message.guild.id)
+        if not watchers:
+            return 0
+    
+    # Find every watched word or phrase in a single pass over the message
+    matches = trigger_index.match(
+        message.content,
+        users=watchers,
+        guild_id=message.guild.id if message.guild else None,
+        channel_ids=(message.channel.id, getattr(message.channel, 'parent_id', None))
+    )
+    
+    # Track which users to notify and what words triggered
+    notifications = {}  # {user_id: [list of triggered words]}
+    
+    for user_id, triggered_words in matches.items():
+        # Don't notify the person who sent the message
+        # if user_id == message.author.id:
+        #     continue
+            
+        # Check if they have notifications enabled (cached, no DB query)
+        if not notification_preferences.is_enabled(user_id):
+            continue
+        
+        notifications[user_id] = triggered_words
+    
+    if not notifications:
+        return 0
+    
+    # The alert text is the same for every recipient, so build it once
+    dm_message = (
+        f"**Alert!**\n\n"
+        # f"**Word(s) detected:** {', '.join(set(triggered_words))}\n"
+        f"**From:** {message.author.name} ({message.author.mention})\n"
+        f"**Server:** {message.guild.name if message.guild else 'DM'}\n"
+        f"**Channel:** {message.channel.mention if hasattr(message.channel, 'mention') else 'DM'}\n"
+        f"**Message:** {message.content[:200]}\n\n"
+        f"[Jump to message]({message.jump_url})"
+    )
+    
+    recipients = notifications.keys()
+    if message.guild:
+        # Only watchers who can read this channel get alerts; the visible set is
+        # cached per channel, so this is one set intersection
+        visible = channel_visibility.get_visible_members(message.channel, watchers)
+        recipients = recipients & visible
+        skipped = len(notifications) - len(recipients)
+        if skipped:
+            logger.debug("Skipping %s user(s) unable to see %s", skipped, message.channel.name)
+    
+    # Queue notifications; the dispatcher sends them concurrently in the background
+    for user_id in recipients:
+        triggered_words = notifications[user_id]
+        
+        # Users in digest mode get one batched DM per window instead
+        digest_window = notification_preferences.get_digest_window(user_id)
+        if digest_window:
+            alert_digest.add(user_id, digest_window, message)
+            continue
+        
+        if dm_dispatcher.enqueue(user_id, dm_message, message.guild):
+            logger.debug("Queued alert for %s for words: %s", user_id, triggered_words)
+    
+    return len(recipients)
@@ -0,0 +1,182 @@
+import bisect
+import logging
+import os
+import time
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Optional Prometheus-style scrape endpoint; off unless METRICS_PORT is set
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PATH = '/metrics'
+
+# Latency buckets in seconds, from sub-millisecond matching up to slow API sweeps
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base for a named metric with optional labels
+
+    Metrics are only updated from the event loop thread, so they carry no lock.
+    """
+    type = 'untyped'
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._function = None
+        _registry.append(self)
+
+    def labels(self, *values):
+        """Get the child metric for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def set_function(self, function):
+        """Read the value from `function` at scrape time, e.g. a queue size"""
+        self._function = function
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        if self._function is not None:
+            try:
+                lines.append(f"{self.name} {float(self._function())}")
+            except Exception:
+                logger.debug("Metric %s could not be read", self.name, exc_info=True)
+            return lines
+        for values, child in self._children.items():
+            lines.extend(child.samples(self.name, _format_labels(self.labelnames, values)))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        return [f"{name}{labels} {self.value}"]
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type = 'counter'
+    _new_child = _Value
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+    type = 'gauge'
+    _new_child = _Value
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValues:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        base = labels[1:-1] + ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{base}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{base}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. latencies in seconds"""
+    type = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValues(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        """Context manager that observes the time spent inside it"""
+        return _Timer(self.labels())
+
+
+class _Timer:
+    __slots__ = ('values', 'started')
+
+    def __init__(self, values):
+        self.values = values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.values.observe(time.perf_counter() - self.started)
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+async def handle_metrics(request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server():
+    """Serve /metrics on METRICS_HOST:METRICS_PORT; returns the runner to clean up on shutdown"""
+    app = web.Application()
+    app.router.add_get(METRICS_PATH, handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, int(METRICS_PORT)).start()
+    logger.info("Serving metrics on %s:%s%s", METRICS_HOST, METRICS_PORT, METRICS_PATH)
+    return runner
@@ -0,0 +1,36 @@
+class NotificationPreferences:
+    """In-memory notification settings: who has alerts off and who gets digests"""
+
+    def __init__(self):
+        self.disabled = set()
+        self.digest_windows = {}  # user_id -> seconds, only for users in digest mode
+
+    def load(self, disabled_user_ids, digest_windows=None):
+        """Replace the cache with the users who have notifications disabled or digests on"""
+        self.disabled = set(disabled_user_ids)
+        self.digest_windows = dict(digest_windows or {})
+
+    def set_enabled(self, user_id, enabled):
+        """Record a user's new notification state"""
+        if enabled:
+            self.disabled.discard(user_id)
+        else:
+            self.disabled.add(user_id)
+
+    def is_enabled(self, user_id):
+        """Check if notifications are enabled for a user (default is enabled)"""
+        return user_id not in self.disabled
+
+    def set_digest_window(self, user_id, seconds):
+        """Record a user's digest window (0 means send alerts immediately)"""
+        if seconds:
+            self.digest_windows[user_id] = seconds
+        else:
+            self.digest_windows.pop(user_id, None)
+
+    def get_digest_window(self, user_id):
+        """Seconds to batch alerts for a user, or 0 for immediate alerts"""
+        return self.digest_windows.get(user_id, 0)
+
+# Global instance
+notification_preferences = NotificationPreferences()
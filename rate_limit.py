@@ -0,0 +1,62 @@
+import asyncio
+import time
+from metrics import Histogram
+
+RATE_LIMIT_WAIT = Histogram('rate_limit_wait_seconds', 'Time spent waiting for a rate limiter token', ['limiter'])
+
+
+def parse_retry_after(value, attempt, max_backoff=30):
+    """Seconds to wait from a Retry-After header, or exponential backoff if absent"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, max_backoff)
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` acquisitions per second, bursting up to `capacity`"""
+
+    def __init__(self, rate, capacity=None, name=None):
+        self.rate = rate
+        self.name = name  # Label for the wait-time metric
+        # At least one whole token, or a rate below 1/s (an hourly quota) never allows a call
+        self.capacity = max(1.0, capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+        # Statistics
+        self.waits = 0
+        self.total_wait = 0.0
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+        waited = time.monotonic() - started
+        if self.name:
+            RATE_LIMIT_WAIT.labels(self.name).observe(waited)
+        if waited > 0.001:
+            self.waits += 1
+            self.total_wait += waited
+
+    def pause(self, seconds):
+        """Hold every caller for `seconds`, e.g. after a 429 with Retry-After"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Start refilling from empty when the pause ends, not from before it
+        self._tokens = 0
+        self._updated = self._paused_until
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The bot's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bags_service builds its global client at import time and needs a key
+os.environ.setdefault('BAGS_API_KEY', 'test')
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import bags_service
+from bags_service import BagsAPIService
+
+
+class PagedFeed:
+    """Stands in for get_token_claim_events over a newest-first list of signatures"""
+
+    def __init__(self, signatures, fail_at_offset=None):
+        self.events = [{'signature': signature} for signature in signatures]
+        self.fail_at_offset = fail_at_offset
+        self.offsets = []
+
+    async def __call__(self, token_mint, limit=100, offset=0):
+        self.offsets.append(offset)
+        if offset == self.fail_at_offset:
+            return {'success': False, 'error': 'timeout'}
+        return {'success': True, 'response': {'events': self.events[offset:offset + limit]}}
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(bags_service, 'BAGS_PAGE_SIZE', 3)
+    monkeypatch.setattr(bags_service, 'BAGS_MAX_PAGES', 4)
+
+
+def fetch(feed, last_seen_signature, service=None):
+    service = service or BagsAPIService()
+    service.get_token_claim_events = feed
+    events, cursor = asyncio.run(service.fetch_claim_events_since('mint', last_seen_signature))
+    return [event['signature'] for event in events], cursor
+
+
+def test_pages_back_to_the_cursor(small_pages):
+    feed = PagedFeed(['s7', 's6', 's5', 's4', 's3', 's2', 's1'])
+
+    assert fetch(feed, 's3') == (['s7', 's6', 's5', 's4'], 's7')
+    assert feed.offsets == [0, 3]
+
+
+def test_cursor_at_the_head_fetches_one_page(small_pages):
+    feed = PagedFeed(['s7', 's6', 's5', 's4'])
+
+    assert fetch(feed, 's7') == ([], 's7')
+    assert feed.offsets == [0]
+
+
+def test_without_a_cursor_only_the_first_page_is_fetched(small_pages):
+    feed = PagedFeed(['s7', 's6', 's5', 's4', 's3'])
+
+    assert fetch(feed, None) == (['s7', 's6', 's5'], 's7')
+    assert feed.offsets == [0]
+
+
+def test_stops_at_a_short_page_when_the_cursor_is_gone(small_pages):
+    feed = PagedFeed(['s5', 's4', 's3', 's2'])
+
+    assert fetch(feed, 'pruned') == (['s5', 's4', 's3', 's2'], 's5')
+    assert feed.offsets == [0, 3]
+
+
+def test_failed_page_keeps_the_cursor(small_pages):
+    feed = PagedFeed(['s7', 's6', 's5', 's4', 's3', 's2', 's1'], fail_at_offset=3)
+
+    assert fetch(feed, 's1') == (['s7', 's6', 's5'], None)
+
+
+def test_keeps_the_cursor_after_max_pages(small_pages):
+    feed = PagedFeed([f's{i}' for i in range(100, 0, -1)])
+
+    signatures, cursor = fetch(feed, 's1')
+    assert signatures == [f's{i}' for i in range(100, 88, -1)]
+    assert cursor is None
+    assert feed.offsets == [0, 3, 6, 9]
+
+
+def test_resumes_a_deep_backlog_on_the_next_poll(small_pages):
+    feed = PagedFeed([f's{i}' for i in range(20, 0, -1)])
+    service = BagsAPIService()
+
+    assert fetch(feed, 's1', service) == ([f's{i}' for i in range(20, 8, -1)], None)
+
+    # Two newer claims arrive before the next poll, shifting the backlog back
+    feed.events[:0] = [{'signature': 's22'}, {'signature': 's21'}]
+    feed.offsets.clear()
+
+    signatures, cursor = fetch(feed, 's1', service)
+    assert signatures == [f's{i}' for i in range(10, 1, -1)]
+    assert cursor == 's20'
+    assert feed.offsets == [12, 15, 18, 21]
+
+    # Then the claims newer than the backlog are picked up as usual
+    assert fetch(feed, 's20', service) == (['s22', 's21'], 's22')
+
+
+def test_failed_backlog_page_is_retried_from_the_same_offset(small_pages):
+    feed = PagedFeed([f's{i}' for i in range(20, 0, -1)])
+    service = BagsAPIService()
+    fetch(feed, 's1', service)
+
+    feed.fail_at_offset = 15
+    assert fetch(feed, 's1', service) == (['s8', 's7', 's6'], None)
+
+    feed.fail_at_offset = None
+    feed.offsets.clear()
+    assert fetch(feed, 's1', service) == (['s8', 's7', 's6', 's5', 's4', 's3', 's2'], 's20')
+    assert feed.offsets == [12, 15, 18]
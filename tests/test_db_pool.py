@@ -0,0 +1,163 @@
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from db_pool import BlockingConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query):
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False  # Dropped by the server without us noticing
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        self.opened = []
+        super().__init__(*args, **kwargs)
+
+    def _connect(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def test_opens_minconn_up_front_and_grows_to_maxconn():
+    pool = FakePool(1, 3, 'dsn')
+    assert len(pool.opened) == 1
+
+    conns = [pool.getconn() for _ in range(3)]
+    assert len(set(map(id, conns))) == 3
+    assert pool.stats()['in_use'] == 3
+    assert pool.stats()['size'] == 3
+
+
+def test_times_out_when_exhausted():
+    pool = FakePool(0, 1, 'dsn', timeout=0.05)
+    pool.getconn()
+
+    started = time.monotonic()
+    with pytest.raises(PoolError):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_waiting_checkout_gets_the_returned_connection():
+    pool = FakePool(0, 1, 'dsn', timeout=5)
+    conn = pool.getconn()
+    got = []
+
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    waiter.join(timeout=5)
+
+    assert got == [conn]
+    assert pool.stats()['waits'] == 1
+
+
+def test_broken_connection_is_discarded_on_return():
+    pool = FakePool(0, 1, 'dsn')
+    conn = pool.getconn()
+    conn.closed = 2
+
+    pool.putconn(conn)
+
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['recycled'] == 1
+    assert pool.getconn() is not conn
+
+
+def test_connection_left_in_a_transaction_is_rolled_back():
+    pool = FakePool(0, 1, 'dsn')
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+
+    pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_dead_idle_connection_is_recycled_on_checkout():
+    pool = FakePool(0, 1, 'dsn', check_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.dead = True
+
+    replacement = pool.getconn()
+
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()['recycled'] == 1
+    assert pool.stats()['size'] == 1
+
+
+def test_recently_returned_connection_is_not_pinged():
+    pool = FakePool(0, 1, 'dsn', check_after=60)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.dead = True  # Would fail a ping, but it was returned just now
+
+    assert pool.getconn() is conn
+
+
+def test_failed_connect_frees_the_reserved_slot():
+    pool = FakePool(0, 1, 'dsn', timeout=0.05)
+
+    def refuse():
+        raise psycopg2.OperationalError("connection refused")
+
+    pool._connect = refuse
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+
+    assert pool.stats()['size'] == 0
+    assert pool.stats()['in_use'] == 0
+
+
+def test_closeall_refuses_further_checkouts():
+    pool = FakePool(1, 2, 'dsn')
+    idle = pool.opened[0]
+
+    pool.closeall()
+
+    assert idle.closed
+    with pytest.raises(PoolError):
+        pool.getconn()
@@ -0,0 +1,133 @@
+import random
+import threading
+
+import pytest
+
+from matcher import AhoCorasick, PhraseMatcher, _on_boundary, joined_words
+from trigger_index import TriggerIndex
+
+
+def brute_force(patterns, text, whole_words):
+    found = set()
+    for pattern in patterns:
+        start = text.find(pattern)
+        while start != -1:
+            if not whole_words or _on_boundary(text, len(text), start, start + len(pattern)):
+                found.add(pattern)
+                break
+            start = text.find(pattern, start + 1)
+    if whole_words:
+        # Words with punctuation inside also match their stripped form
+        found.update(set(patterns) & set(joined_words(text)))
+    return found
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('the server down again', {'server down', 'down'}),
+    ('serverdown', set()),
+    ('i love c++ and c', {'c++'}),
+    ('to the moon 🚀', {'moon', '🚀'}),
+    ('moonshot', set()),
+    ('(moon)', {'moon'}),
+    ("i don't know, send an e-mail", {"don't", 'dont', 'email'}),
+    ('dont', {'dont'}),
+    ("don't", {"don't", 'dont'}),
+])
+def test_phrase_matcher_finds_whole_words(text, expected):
+    matcher = PhraseMatcher(['server down', 'down', 'c++', 'moon', '🚀', 'dont', "don't", 'email'])
+    assert matcher.find(text) == expected
+
+
+def test_aho_corasick_finds_substrings():
+    matcher = AhoCorasick(['he', 'she', 'his', 'hers'])
+    assert matcher.find('ushers') == {'he', 'she', 'hers'}
+
+
+def test_matchers_agree_with_brute_force_through_adds_and_removes():
+    rng = random.Random(7)
+    alphabet = 'ab c+-🚀'
+    for _ in range(500):
+        patterns = {''.join(rng.choices(alphabet, k=rng.randint(1, 4))).strip() for _ in range(rng.randint(1, 8))}
+        patterns.discard('')
+        patterns.add('a')
+        text = ''.join(rng.choices(alphabet, k=rng.randint(0, 20)))
+
+        built, added = sorted(patterns)[:2], sorted(patterns)[2:]
+        phrases = PhraseMatcher(built)
+        automaton = AhoCorasick(built)
+        for pattern in added:
+            phrases.add(pattern)
+            automaton.add(pattern)
+        assert phrases.find(text) == brute_force(patterns, text, True)
+        assert automaton.find(text) == brute_force(patterns, text, False)
+
+        removed = rng.choice(sorted(patterns))
+        phrases.remove(removed)
+        automaton.remove(removed)
+        patterns.discard(removed)
+        assert phrases.find(text) == brute_force(patterns, text, True)
+        assert automaton.find(text) == brute_force(patterns, text, False)
+        assert len(phrases) == len(automaton) == len(patterns)
+
+
+def test_aho_corasick_asks_for_a_rebuild_once_enough_changed():
+    matcher = AhoCorasick(['seed'])
+    for i in range(300):
+        matcher.add(f'word{i}')
+    assert matcher.needs_rebuild()
+    assert matcher.find('xx word299 yy') >= {'word299'}
+
+
+def test_trigger_index_matches_phrases_scopes_and_candidates():
+    index = TriggerIndex()
+    index.load([
+        (1, 'server down', None, None),
+        (2, 'server down', 10, None),
+        (3, 'down', None, 99),
+    ])
+
+    hits = index.match('Is the SERVER\n down?', guild_id=10, channel_ids=(5, None))
+    assert hits == {1: ['server down'], 2: ['server down']}
+    assert index.match('server down', guild_id=11, channel_ids=(5, None)) == {1: ['server down']}
+    assert index.match('down', channel_ids=(99, None)) == {3: ['down']}
+    assert index.match('server down', users={2}, guild_id=10) == {2: ['server down']}
+
+
+def test_trigger_index_add_and_remove_are_visible_immediately():
+    index = TriggerIndex()
+    index.load([(1, 'alpha', None, None)])
+
+    index.add(2, 'beta')
+    assert index.match('beta') == {2: ['beta']}
+
+    index.remove(2, 'beta')
+    assert index.match('beta') == {}
+    assert not index.is_watcher(2)
+    assert len(index) == 1
+
+
+def test_substring_index_swaps_in_a_rebuilt_automaton_without_losing_changes():
+    index = TriggerIndex(whole_words=False)
+    index.load([(1, 'alpha', None, None)])
+
+    for i in range(300):
+        index.add(2, f'word{i}x')
+    index.remove(1, 'alpha')
+    for thread in threading.enumerate():
+        if thread.name == 'trigger-matcher-rebuild':
+            thread.join(timeout=10)
+
+    assert index.match('zz word299x alpha') == {2: ['word299x']}
+    assert index.match('word0x') == {2: ['word0x']}
+
+
+def test_prefilter_never_rejects_a_message_that_matches():
+    index = TriggerIndex()
+    index.load([(1, 'server down', None, None), (2, 'c++', None, None), (3, '🚀', None, None)])
+
+    index.add(4, 'email')
+    for text in ['server down', 'c++ rocks', 'to the 🚀', 'nothing relevant here', 'serverdown', 'an E-mail']:
+        assert index.might_match(text) or not index.match(text)
+    assert not index.might_match('nothing relevant here')
+    assert index.match('Send an E-mail!') == {4: ['email']}
+    assert index.prefilter_stats()['untokenised'] == 1
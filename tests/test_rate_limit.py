@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limit import TokenBucket, parse_retry_after
+
+
+def acquire_times(bucket, count, pause=None):
+    """Seconds after the start at which each of `count` concurrent callers got a token"""
+    async def run():
+        started = time.monotonic()
+        if pause:
+            bucket.pause(pause)
+        times = []
+
+        async def take():
+            await bucket.acquire()
+            times.append(time.monotonic() - started)
+
+        await asyncio.gather(*(take() for _ in range(count)))
+        return sorted(times)
+
+    return asyncio.run(run())
+
+
+def test_bursts_up_to_capacity_then_follows_the_rate():
+    times = acquire_times(TokenBucket(20, capacity=3), 5)
+
+    assert times[2] < 0.03
+    assert times[3] == pytest.approx(0.05, abs=0.03)
+    assert times[4] == pytest.approx(0.10, abs=0.03)
+
+
+def test_pause_holds_callers_and_does_not_refill_while_paused():
+    times = acquire_times(TokenBucket(20, capacity=3), 3, pause=0.2)
+
+    # Refilling starts from empty when the pause ends, so no burst follows it
+    assert times[0] == pytest.approx(0.25, abs=0.03)
+    assert times[2] == pytest.approx(0.35, abs=0.03)
+
+
+def test_rate_below_one_per_second_still_allows_calls():
+    bucket = TokenBucket(0.5)
+
+    assert bucket.capacity == 1
+    assert acquire_times(bucket, 1)[0] < 0.03
+    assert bucket._tokens < 1
+
+
+def test_records_waits():
+    bucket = TokenBucket(50, capacity=1)
+    acquire_times(bucket, 3)
+    assert bucket.waits == 2
+    assert bucket.total_wait > 0
+
+
+@pytest.mark.parametrize('value, attempt, expected', [
+    ('2.5', 0, 2.5),
+    (None, 0, 1),
+    (None, 3, 8),
+    ('soon', 10, 30),
+])
+def test_parse_retry_after(value, attempt, expected):
+    assert parse_retry_after(value, attempt) == expected
@@ -0,0 +1,101 @@
+"""Compare the trigger matchers with the old split-and-lookup loop.
+
+Usage: python tools/bench_matcher.py [trigger_count ...]
+Defaults to 10k, 100k and 1M triggers. "token matcher" is the default
+whole-word mode; "aho-corasick" is the substring mode (TRIGGER_WHOLE_WORDS=false).
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trigger_index import TriggerIndex
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+MESSAGE_COUNT = 2_000
+PHRASE_RATIO = 0.05
+
+
+def random_word(rng):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+
+def make_triggers(rng, count):
+    triggers = []
+    for user_id in range(count):
+        if rng.random() < PHRASE_RATIO:
+            word = f"{random_word(rng)} {random_word(rng)}"
+        else:
+            word = random_word(rng)
+        triggers.append((user_id, word, None, None))
+    return triggers
+
+
+def make_messages(rng, triggers, count):
+    messages = []
+    for _ in range(count):
+        words = [random_word(rng) for _ in range(rng.randint(5, 40))]
+        # Roughly one message in five mentions a real trigger
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), rng.choice(triggers)[1] + rng.choice(['', '!', ',', '?']))
+        messages.append(' '.join(words).capitalize())
+    return messages
+
+
+def split_loop(index, content):
+    """The pre-automaton on_message matching loop, with in-memory lookups"""
+    notifications = {}
+    for word in content.lower().split():
+        clean_word = ''.join(char for char in word if char.isalnum())
+        if not clean_word:
+            continue
+        for user_id in index.get_users(clean_word):
+            notifications.setdefault(user_id, []).append(clean_word)
+    return notifications
+
+
+def run(size, rng):
+    triggers = make_triggers(rng, size)
+    messages = make_messages(rng, triggers, MESSAGE_COUNT)
+
+    started = time.perf_counter()
+    index = TriggerIndex()
+    index.load(triggers)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    substrings = TriggerIndex(whole_words=False)
+    substrings.load(triggers)
+    automaton_time = time.perf_counter() - started
+
+    results = {}
+    for name, match in (('split loop', lambda content: split_loop(index, content)),
+                        ('token matcher', index.match),
+                        ('pre-filtered', lambda content: index.match(content) if index.might_match(content) else {}),
+                        ('aho-corasick', substrings.match)):
+        hits = 0
+        started = time.perf_counter()
+        for content in messages:
+            hits += len(match(content))
+        elapsed = time.perf_counter() - started
+        results[name] = (len(messages) / elapsed, hits)
+
+    print(f"{size:>9,} triggers  build {build_time:6.2f}s  (automaton {automaton_time:6.2f}s)")
+    for name, (rate, hits) in results.items():
+        print(f"    {name:<13} {rate:>10,.0f} msg/s  {hits:>6} user hits")
+    stats = index.prefilter_stats()
+    print(f"    pre-filter rejected {stats['rejected']:,} of {stats['checked']:,} messages")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    rng = random.Random(1234)
+    for size in sizes:
+        run(size, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Offline load test for the message alert and claim polling pipelines.
+
+Usage: python tools/bench_pipeline.py [--messages N] [--guilds N] [--members N]
+                                      [--triggers-per-user N] [--tokens N] [--sweeps N]
+
+Drives handle_message with synthetic guilds, members and messages against an
+in-memory database and recording DM channels, then sweeps every monitored
+token against a local fake Bags API. Reports messages/sec, p50/p99 alert
+latency (message created to DM sent), DB queries per message and API calls
+per sweep. Nothing here talks to Discord, Postgres or Bags.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The real ceilings are Discord's and Bags' quotas; lift them so the numbers
+# measure our own code
+os.environ.setdefault('DM_RATE_LIMIT', '1000000')
+os.environ.setdefault('BAGS_API_RATE_LIMIT', '1000000')
+os.environ.setdefault('BAGS_API_KEY', 'bench')
+
+from fakes import FakeBot, FakeGuild, FakeMember, FakeChannel, FakeMessage, FakeBagsServer, install_fake_database
+
+database = install_fake_database()
+
+import async_database
+from bench_matcher import random_word
+from bags_service import bags_service
+from dm_dispatcher import dm_dispatcher
+from guild_watchers import guild_watchers
+from message_monitor import handle_message
+from trigger_index import trigger_index
+from user_resolver import user_resolver
+
+WATCHER_RATIO = 0.2
+CHANNELS_PER_GUILD = 10
+HIDDEN_RATIO = 0.1   # Members who can't read a given channel
+MENTION_RATIO = 0.2  # Messages containing a watched word
+NEW_CLAIM_RATIO = 0.1  # Tokens that see new claims between sweeps
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def build_guilds(rng, bot, args, vocabulary):
+    for g in range(args.guilds):
+        guild = FakeGuild(f"guild{g}")
+        bot.guilds.append(guild)
+        for _ in range(args.members):
+            guild.add_member(FakeMember(bot, guild))
+        members = guild.members
+        for member in rng.sample(members, int(len(members) * WATCHER_RATIO)):
+            for word in rng.sample(vocabulary, args.triggers_per_user):
+                database.triggers.append((member.id, word, None, None))
+        for c in range(CHANNELS_PER_GUILD):
+            hidden = [member.id for member in rng.sample(members, int(len(members) * HIDDEN_RATIO))]
+            guild.channels.append(FakeChannel(guild, f"channel{c}", hidden))
+
+
+def make_messages(rng, bot, vocabulary, count):
+    messages = []
+    for _ in range(count):
+        guild = rng.choice(bot.guilds)
+        words = [random_word(rng) for _ in range(rng.randint(5, 40))]
+        if rng.random() < MENTION_RATIO:
+            words.insert(rng.randrange(len(words)), rng.choice(vocabulary))
+        author = rng.choice(guild.members)
+        messages.append(FakeMessage(author, rng.choice(guild.channels), ' '.join(words).capitalize()))
+    return messages
+
+
+async def bench_messages(rng, bot, args):
+    vocabulary = [random_word(rng) for _ in range(args.vocabulary)]
+    build_guilds(rng, bot, args, vocabulary)
+    messages = make_messages(rng, bot, vocabulary, args.messages)
+
+    await async_database.load_trigger_index()
+    await async_database.load_notification_preferences()
+    guild_watchers.load(bot.guilds)
+    dm_dispatcher.start(bot)
+
+    print(f"{len(bot.guilds)} guild(s), {args.guilds * args.members:,} member(s), "
+          f"{len(trigger_index):,} trigger(s), {len(messages):,} message(s)")
+
+    queries = sum(database.queries.values())
+    created = {}
+    alerts = 0
+    started = time.perf_counter()
+    for message in messages:
+        message.created = time.perf_counter()
+        created[message.jump_url] = message.created
+        alerts += await handle_message(message)
+        # The gateway yields between events; let the DM workers run
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    await dm_dispatcher.queue.join()
+    await dm_dispatcher.stop()
+    queries = sum(database.queries.values()) - queries
+
+    latencies = sorted(
+        (sent_at - created[content[content.rindex('(') + 1:-1]]) * 1000
+        for _, content, sent_at in bot.sent
+    )
+    stats = trigger_index.prefilter_stats()
+    print(f"  {len(messages) / elapsed:>10,.0f} msg/s  ({alerts:,} alert(s), {len(bot.sent):,} DM(s) sent)")
+    print(f"  alert latency p50 {percentile(latencies, 0.5):.2f} ms  p99 {percentile(latencies, 0.99):.2f} ms")
+    print(f"  DB queries per message {queries / len(messages):.3f}")
+    print(f"  Discord API calls per DM {sum(bot.api_calls.values()) / max(1, len(bot.sent)):.2f}  "
+          f"({dict(bot.api_calls)}, resolver hits {user_resolver.hits:,})")
+    print(f"  pre-filter rejected {stats['rejected']:,} of {stats['checked']:,} message(s)")
+
+
+async def bench_claims(rng, args):
+    server = FakeBagsServer()
+    await server.start()
+    bags_service.base_url = server.base_url
+
+    for i in range(args.tokens):
+        token_mint = f"mint{i}"
+        database.monitors[token_mint] = [None, 0, None]
+        server.add_claims(token_mint, rng.randint(0, 3))
+
+    print(f"{args.tokens:,} monitored token(s), {args.sweeps} sweep(s)")
+    for sweep in range(args.sweeps):
+        if sweep:
+            for token_mint in rng.sample(list(database.monitors), max(1, int(args.tokens * NEW_CLAIM_RATIO))):
+                server.add_claims(token_mint, rng.randint(1, 3))
+
+        calls = server.calls
+        queries = sum(database.queries.values())
+        started = time.perf_counter()
+        new_events = await bags_service.check_new_claims_for_all_tokens()
+        elapsed = time.perf_counter() - started
+        print(f"  sweep {sweep + 1}: {elapsed * 1000:7.0f} ms  {server.calls - calls:>5} API call(s)  "
+              f"{sum(database.queries.values()) - queries:>5} DB queries  {len(new_events):>5} new claim(s)")
+
+    await bags_service.close()
+    await server.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--members', type=int, default=1_000, help="members per guild")
+    parser.add_argument('--triggers-per-user', type=int, default=20)
+    parser.add_argument('--vocabulary', type=int, default=5_000, help="distinct trigger words")
+    parser.add_argument('--tokens', type=int, default=500)
+    parser.add_argument('--sweeps', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    await bench_messages(rng, FakeBot(), args)
+    print()
+    await bench_claims(rng, args)
+    async_database.db_executor.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
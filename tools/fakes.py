@@ -0,0 +1,275 @@
+"""Stand-ins for Discord objects, the database module and the Bags API.
+
+Used by the offline benchmarks so the message and claim pipelines can run
+without a gateway connection, Postgres or network access. Only the attributes
+the pipelines actually touch are implemented.
+"""
+import itertools
+import sys
+import time
+import types
+from collections import Counter
+
+from aiohttp import web
+
+_ids = itertools.count(100_000_000_000_000_000)  # Snowflake-sized IDs
+
+
+def next_id():
+    return next(_ids)
+
+
+class Permissions:
+    __slots__ = ('read_messages',)
+
+    def __init__(self, read_messages):
+        self.read_messages = read_messages
+
+
+class FakeDMChannel:
+    def __init__(self, bot, user_id):
+        self.id = next_id()
+        self.bot = bot
+        self.user_id = user_id
+
+    async def send(self, content=None, **kwargs):
+        self.bot.api_calls['send_dm'] += 1
+        self.bot.sent.append((self.user_id, content, time.perf_counter()))
+
+
+class FakeMember:
+    def __init__(self, bot, guild, user_id=None, name=None):
+        self.id = user_id or next_id()
+        self.name = name or f"user{self.id % 100_000}"
+        self.mention = f"<@{self.id}>"
+        self.bot = False
+        self.guild = guild
+        self.dm_channel = None
+        self._bot = bot
+
+    async def create_dm(self):
+        self._bot.api_calls['create_dm'] += 1
+        self.dm_channel = FakeDMChannel(self._bot, self.id)
+        self._bot.dm_channels[self.dm_channel.id] = self.dm_channel
+        return self.dm_channel
+
+    def __str__(self):
+        return self.name
+
+
+class FakeChannel:
+    """Guild text channel; members in `hidden` cannot read it"""
+
+    def __init__(self, guild, name, hidden=()):
+        self.id = next_id()
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.guild = guild
+        self.parent_id = None
+        self.hidden = set(hidden)
+
+    def permissions_for(self, member):
+        return Permissions(member.id not in self.hidden)
+
+
+class FakeGuild:
+    def __init__(self, name):
+        self.id = next_id()
+        self.name = name
+        self._members = {}
+        self.channels = []
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def add_member(self, member):
+        self._members[member.id] = member
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    def get_channel(self, channel_id):
+        return next((channel for channel in self.channels if channel.id == channel_id), None)
+
+
+class FakeMessage:
+    def __init__(self, author, channel, content):
+        self.id = next_id()
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.jump_url = f"https://discord.com/channels/{self.guild.id}/{channel.id}/{self.id}"
+        self.created = time.perf_counter()
+
+
+class FakeBot:
+    """Just enough of discord.Client for user_resolver and dm_dispatcher"""
+
+    def __init__(self):
+        self.guilds = []
+        self.dm_channels = {}
+        self.sent = []  # (user_id, content, sent_at)
+        self.api_calls = Counter()
+
+    def get_user(self, user_id):
+        return None
+
+    async def fetch_user(self, user_id):
+        self.api_calls['fetch_user'] += 1
+        for guild in self.guilds:
+            member = guild.get_member(user_id)
+            if member is not None:
+                return member
+        raise LookupError(user_id)
+
+    def get_partial_messageable(self, channel_id, type=None):
+        return self.dm_channels[channel_id]
+
+
+def install_fake_database():
+    """Register an in-memory `database` module and return it
+
+    Must run before anything imports async_database. Every call is counted in
+    `module.queries`, one per function call, which matches the one or two
+    statements each real function runs.
+    """
+    from trigger_index import trigger_index
+    from preferences import notification_preferences
+
+    db = types.ModuleType('database')
+    db.DB_POOL_SIZE = 10
+    db.MAX_TRIGGERS_PER_USER = 200
+    db.queries = Counter()
+    db.triggers = []            # (user_id, word, guild_id, channel_id)
+    db.disabled = set()
+    db.digest_windows = {}
+    db.monitors = {}            # token_mint -> [poll_interval, next_check_at, last_seen_signature]
+    db.claim_events = {}        # signature -> (token_mint, wallet, is_creator, amount, timestamp, notified)
+
+    class TriggerLimitError(Exception):
+        pass
+
+    db.TriggerLimitError = TriggerLimitError
+
+    def counted(func):
+        def wrapper(*args):
+            db.queries[func.__name__] += 1
+            return func(*args)
+        wrapper.__name__ = func.__name__
+        setattr(db, func.__name__, wrapper)
+        return wrapper
+
+    @counted
+    def load_trigger_index():
+        trigger_index.load(db.triggers)
+
+    @counted
+    def load_notification_preferences():
+        notification_preferences.load(db.disabled, db.digest_windows)
+
+    @counted
+    def get_poll_schedule(due_only=True):
+        now = time.time()
+        return [
+            (token_mint, poll_interval, last_seen)
+            for token_mint, (poll_interval, next_check_at, last_seen) in db.monitors.items()
+            if not due_only or next_check_at <= now
+        ]
+
+    @counted
+    def update_poll_schedule(token_mint, poll_interval, had_claims, last_seen_signature=None):
+        monitor = db.monitors[token_mint]
+        monitor[0] = poll_interval
+        monitor[1] = time.time() + poll_interval
+        if last_seen_signature:
+            monitor[2] = last_seen_signature
+
+    @counted
+    def ingest_claim_events(token_mint, events, poll_intervals=None, last_seen_signature=None):
+        new = []
+        for row in events:
+            if row[0] not in db.claim_events:
+                db.claim_events[row[0]] = (token_mint,) + tuple(row[1:]) + (False,)
+                new.append(tuple(row))
+        if poll_intervals:
+            monitor = db.monitors[token_mint]
+            monitor[0] = poll_intervals[0] if new else poll_intervals[1]
+            monitor[1] = time.time() + monitor[0]
+            if last_seen_signature:
+                monitor[2] = last_seen_signature
+        return new
+
+    @counted
+    def get_unnotified_claim_events(limit=None):
+        rows = [
+            (signature, token_mint, wallet, is_creator, amount, timestamp)
+            for signature, (token_mint, wallet, is_creator, amount, timestamp, notified) in db.claim_events.items()
+            if not notified
+        ]
+        return rows[:limit] if limit else rows
+
+    @counted
+    def mark_claim_events_notified(signatures):
+        for signature in signatures:
+            db.claim_events[signature] = db.claim_events[signature][:-1] + (True,)
+
+    # Everything else the real module exports, so async_database can wrap it
+    for name in ('init_connection_pool', 'init_db', 'get_pool_stats', 'open_listen_connection',
+                 'open_dedicated_connection', 'try_leader_lock', 'check_connection', 'publish_reload_marker',
+                 'get_user_triggers', 'get_all_users_monitoring', 'add_trigger_word', 'add_multiple_trigger_words',
+                 'remove_trigger_word', 'is_notifications_enabled', 'toggle_notifications',
+                 'set_digest_window', 'add_token_monitor', 'remove_token_monitor',
+                 'get_all_monitored_tokens', 'update_last_checked', 'add_claim_event',
+                 'mark_claim_event_notified', 'get_bot_state', 'set_bot_state'):
+        def not_faked(*args, name=name):
+            raise NotImplementedError(f"database.{name} is not faked")
+        not_faked.__name__ = name
+        counted(not_faked)
+
+    sys.modules['database'] = db
+    return db
+
+
+class FakeBagsServer:
+    """Local Bags API serving claim-events pages from an in-memory feed"""
+
+    def __init__(self):
+        self.events = {}  # token_mint -> events, newest first
+        self.calls = 0
+        self._runner = None
+        self.base_url = None
+
+    def add_claims(self, token_mint, count):
+        events = self.events.setdefault(token_mint, [])
+        for _ in range(count):
+            events.insert(0, {
+                'signature': f"sig{next_id()}",
+                'wallet': f"wallet{next_id() % 10_000}",
+                'isCreator': False,
+                'amount': '0.01',
+                'timestamp': str(int(time.time())),
+            })
+
+    async def handle_claim_events(self, request):
+        self.calls += 1
+        token_mint = request.query['tokenMint']
+        limit = int(request.query.get('limit', 100))
+        offset = int(request.query.get('offset', 0))
+        page = self.events.get(token_mint, [])[offset:offset + limit]
+        return web.json_response({'success': True, 'response': {'events': page}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/api/v1/fee-share/token/claim-events', self.handle_claim_events)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/api/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
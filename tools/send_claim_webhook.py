@@ -0,0 +1,63 @@
+"""Stand-in for the Bags push sender: POST signed synthetic claim events to the bot.
+
+Usage: python tools/send_claim_webhook.py <token_mint> [count] [url]
+Uses BAGS_WEBHOOK_SECRET from the environment; the URL defaults to
+http://127.0.0.1:$BAGS_WEBHOOK_PORT/bags/claims.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook_server import sign_payload, SIGNATURE_HEADER, TIMESTAMP_HEADER
+
+
+def make_events(count):
+    return [
+        {
+            'signature': uuid.uuid4().hex,
+            'wallet': uuid.uuid4().hex[:32],
+            'isCreator': i == 0,
+            'amount': f"{0.01 * (i + 1):.2f}",
+            'timestamp': str(int(time.time())),
+        }
+        for i in range(count)
+    ]
+
+
+async def send(url, secret, token_mint, events):
+    body = json.dumps({'tokenMint': token_mint, 'events': events}).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: sign_payload(secret, timestamp, body),
+    }
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, data=body, headers=headers) as response:
+            print(response.status, await response.text())
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    secret = os.environ.get('BAGS_WEBHOOK_SECRET')
+    if not secret:
+        sys.exit("BAGS_WEBHOOK_SECRET environment variable not set")
+
+    token_mint = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    port = os.environ.get('BAGS_WEBHOOK_PORT', '8080')
+    url = sys.argv[3] if len(sys.argv) > 3 else f"http://127.0.0.1:{port}/bags/claims"
+
+    asyncio.run(send(url, secret, token_mint, make_events(count)))
+
+
+if __name__ == '__main__':
+    main()
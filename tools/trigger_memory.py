@@ -0,0 +1,96 @@
+"""Measure how much memory the trigger store needs per (user, word) pair.
+
+Usage: python tools/trigger_memory.py [--substrings] [trigger_count ...]
+Defaults to 100k and 1M triggers. Compares the compact TriggerIndex with the
+old dict-of-sets layout using tracemalloc, and prints the index's own estimate.
+Each size is measured twice: with popular words shared by many users, and with
+mostly distinct words (the bench_matcher distribution), which is the worst case
+for anything stored per word. Substring mode (TRIGGER_WHOLE_WORDS=false) is
+shown separately; its automaton costs several hundred bytes per distinct word.
+"""
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trigger_index import TriggerIndex
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+TRIGGERS_PER_USER = 20
+# Distinct words per trigger: popular words shared ~20 ways, or nearly all distinct
+VOCABULARY_RATIOS = {'shared words': 0.05, 'distinct words': 1.0}
+
+
+def make_triggers(rng, count, vocabulary_ratio):
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+                  for _ in range(max(1, int(count * vocabulary_ratio)))]
+    triggers = set()
+    user_base = 100_000_000_000_000_000  # Discord snowflakes are ~18 digits
+    while len(triggers) < count:
+        user_id = user_base + rng.randrange(count // TRIGGERS_PER_USER + 1)
+        # Skewed towards the start of the vocabulary, like real trigger words
+        word = vocabulary[int(len(vocabulary) * rng.random() ** 3)]
+        triggers.add((user_id, word))
+    return sorted(((user_id, word, None, None) for user_id, word in triggers), key=lambda row: (row[1], row[0]))
+
+
+def dict_of_sets(rows):
+    """The previous layout: word -> set of user IDs, plus a watcher count per user"""
+    words = {}
+    watchers = {}
+    for user_id, word, _, _ in rows:
+        words.setdefault(word, set()).add(user_id)
+        watchers[user_id] = watchers.get(user_id, 0) + 1
+    return words, watchers
+
+
+def measure(build, rows):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(rows)
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def run(size, rng, distribution, substrings):
+    rows = make_triggers(rng, size, VOCABULARY_RATIOS[distribution])
+    words = len({row[1] for row in rows})
+    print(f"\n{size:,} triggers, {words:,} distinct words ({distribution})")
+
+    _, baseline_bytes, baseline_time = measure(dict_of_sets, rows)
+    print(f"  dict of sets     {baseline_bytes / size:8.1f} bytes/trigger  (build {baseline_time:.2f}s, no automaton)")
+
+    modes = [('whole words', True)] + ([('substrings', False)] if substrings else [])
+    for mode, whole_words in modes:
+        def build_index(rows):
+            index = TriggerIndex(whole_words=whole_words)
+            index.load(rows)
+            return index
+
+        index, index_bytes, index_time = measure(build_index, rows)
+        report = index.memory_report()
+        print(f"  {mode:<16} {index_bytes / size:8.1f} bytes/trigger  (build {index_time:.2f}s; "
+              f"memory_report {report['bytes_per_trigger']:.1f}: index {report['index_bytes'] / size:.1f}, "
+              f"matcher {report['matcher_bytes'] / size:.1f})")
+        del index
+
+
+def main():
+    args = sys.argv[1:]
+    # Building the substring automaton for millions of words is slow; opt in
+    substrings = '--substrings' in args
+    sizes = [int(arg) for arg in args if arg != '--substrings'] or DEFAULT_SIZES
+    rng = random.Random(42)
+    for size in sizes:
+        for distribution in VOCABULARY_RATIOS:
+            run(size, rng, distribution, substrings)
+
+
+if __name__ == '__main__':
+    main()
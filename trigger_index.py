@@ -0,0 +1,285 @@
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from matcher import TOKEN_RE, AhoCorasick, PhraseMatcher, joined_words
+
+# Only report triggers that appear as whole words ("cat" won't match "concatenate")
+WHOLE_WORDS = os.environ.get('TRIGGER_WHOLE_WORDS', 'true').lower() != 'false'
+
+
+def normalise_text(text):
+    """Lowercase text and collapse whitespace so phrases match across line breaks"""
+    return ' '.join(text.lower().split())
+
+
+class TriggerScope:
+    """Guild or channel restriction on one (user, word) trigger"""
+    __slots__ = ('guild_id', 'channel_id')
+
+    def __init__(self, guild_id, channel_id):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+
+    def allows(self, guild_id, channel_ids):
+        if self.channel_id is not None:
+            return self.channel_id in channel_ids
+        return self.guild_id is None or self.guild_id == guild_id
+
+
+def _contains(posting, user_id):
+    i = bisect_left(posting, user_id)
+    return i < len(posting) and posting[i] == user_id
+
+
+class TriggerIndex:
+    """Compact in-memory index of trigger words and the users watching them
+
+    Each distinct word is interned and given an integer ID; the users watching
+    it are a sorted array('q') posting list, so a (user, word) pair costs about
+    8 bytes on top of its share of the word itself. Each distinct word costs
+    roughly 150 bytes more (string, posting array, dict slots), so totals range
+    from ~25 bytes per trigger when words are widely shared to ~115 when most
+    are unique. Substring mode adds an automaton of ~600 bytes per distinct word.
+    """
+
+    def __init__(self, whole_words=WHOLE_WORDS):
+        self.word_ids = {}   # word -> word ID
+        self.words = []      # word ID -> word (None once freed)
+        self.postings = []   # word ID -> sorted array('q') of user IDs
+        self.watchers = {}   # user_id -> number of words they watch
+        self.scopes = {}     # (user_id, word ID) -> TriggerScope, only for scoped triggers
+        self.pairs = 0
+        self._free_ids = []
+        self.whole_words = whole_words
+        self.matcher = self._new_matcher()
+        self._rebuild_changes = None  # (added, word) made while a new automaton is built
+        self.checked = 0
+        self.rejected = 0
+        # Writes come from database worker threads while the event loop scans
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        """Replace the index contents with (user_id, trigger_word, guild_id, channel_id) rows"""
+        word_ids = {}
+        words = []
+        postings = []
+        watchers = {}
+        scopes = {}
+        pairs = 0
+        for user_id, word, guild_id, channel_id in rows:
+            word_id = word_ids.get(word)
+            if word_id is None:
+                word = sys.intern(word)
+                word_id = word_ids[word] = len(words)
+                words.append(word)
+                postings.append(array('q'))
+            postings[word_id].append(user_id)
+            watchers[user_id] = watchers.get(user_id, 0) + 1
+            if guild_id or channel_id:
+                scopes[(user_id, word_id)] = TriggerScope(guild_id, channel_id)
+            pairs += 1
+
+        # Rows arrive sorted from the database, making this a cheap linear pass
+        for word_id, posting in enumerate(postings):
+            postings[word_id] = array('q', sorted(posting))
+
+        matcher = self._new_matcher(words)
+        with self._lock:
+            self.word_ids = word_ids
+            self.words = words
+            self.postings = postings
+            self.watchers = watchers
+            self.scopes = scopes
+            self.pairs = pairs
+            self._free_ids = []
+            self.matcher = matcher
+            self._rebuild_changes = None  # Any rebuild in flight started from the old words
+
+    def add(self, user_id, word, guild_id=None, channel_id=None):
+        """Record that a user is watching a word, optionally only in one guild or channel"""
+        with self._lock:
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self._new_word(word)
+            posting = self.postings[word_id]
+            i = bisect_left(posting, user_id)
+            if i == len(posting) or posting[i] != user_id:
+                posting.insert(i, user_id)
+                self.watchers[user_id] = self.watchers.get(user_id, 0) + 1
+                self.pairs += 1
+            if guild_id or channel_id:
+                self.scopes[(user_id, word_id)] = TriggerScope(guild_id, channel_id)
+
+    def remove(self, user_id, word):
+        """Forget that a user is watching a word"""
+        with self._lock:
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                return
+            posting = self.postings[word_id]
+            i = bisect_left(posting, user_id)
+            if i == len(posting) or posting[i] != user_id:
+                return
+            del posting[i]
+            self.pairs -= 1
+            self.scopes.pop((user_id, word_id), None)
+            if not posting:
+                self._free_word(word_id)
+            if self.watchers[user_id] > 1:
+                self.watchers[user_id] -= 1
+            else:
+                del self.watchers[user_id]
+
+    def get_users(self, word):
+        """Get all users watching a word"""
+        word_id = self.word_ids.get(word)
+        return self.postings[word_id] if word_id is not None else ()
+
+    def is_watcher(self, user_id):
+        """Check if a user watches at least one word"""
+        return user_id in self.watchers
+
+    def might_match(self, content):
+        """Cheap check that rejects most messages that cannot trigger anything"""
+        self.checked += 1
+        if not self.whole_words:
+            return True
+        # A whole-word hit means the trigger's first token is also a token of
+        # the message, so a message sharing none of them can be skipped
+        content = content.lower()
+        tokens = self.matcher.tokens()
+        if not tokens.isdisjoint(TOKEN_RE.findall(content)) or not tokens.isdisjoint(joined_words(content)):
+            return True
+        # The few triggers with no token at all (an emoji) are plain substrings
+        untokenised = self.matcher.untokenised()
+        if untokenised:
+            text = normalise_text(content)
+            if any(pattern in text for pattern in untokenised):
+                return True
+        self.rejected += 1
+        return False
+
+    def prefilter_stats(self):
+        """How many messages the pre-filter saw and how many it rejected"""
+        return {
+            'checked': self.checked,
+            'rejected': self.rejected,
+            'reject_rate': self.rejected / self.checked if self.checked else 0.0,
+            'tokens': len(self.matcher.tokens()) if self.whole_words else 0,
+            'untokenised': len(self.matcher.untokenised()) if self.whole_words else 0,
+        }
+
+    def match(self, content, users=None, guild_id=None, channel_ids=()):
+        """Scan message content once and return {user_id: [triggered words]}
+
+        `users` limits the hits to a set of candidates (e.g. the watchers in the
+        message's guild); scoped triggers only fire in their guild or channel.
+        """
+        text = normalise_text(content)
+        hits = {}
+        with self._lock:
+            scopes = self.scopes
+            for word in self.matcher.find(text):
+                word_id = self.word_ids.get(word)
+                if word_id is None:
+                    continue
+                watching = self.postings[word_id]
+                if users is not None:
+                    # Walk whichever side is smaller
+                    if len(users) < len(watching):
+                        watching = [user_id for user_id in users if _contains(watching, user_id)]
+                    else:
+                        watching = [user_id for user_id in watching if user_id in users]
+                for user_id in watching:
+                    scope = scopes.get((user_id, word_id)) if scopes else None
+                    if scope and not scope.allows(guild_id, channel_ids):
+                        continue
+                    hits.setdefault(user_id, []).append(word)
+        return hits
+
+    def memory_report(self):
+        """Approximate bytes held by the index and the automaton, and per (user, word) pair"""
+        with self._lock:
+            index_bytes = (
+                sys.getsizeof(self.word_ids) + sys.getsizeof(self.words) + sys.getsizeof(self.postings)
+                + sum(sys.getsizeof(word) for word in self.words if word is not None)
+                + sum(sys.getsizeof(posting) for posting in self.postings if posting is not None)
+                + sys.getsizeof(self.watchers)
+                + sum(sys.getsizeof(user_id) + sys.getsizeof(count) for user_id, count in self.watchers.items())
+                + sys.getsizeof(self.scopes)
+                + sum(sys.getsizeof(key) + sys.getsizeof(scope) for key, scope in self.scopes.items())
+            )
+            matcher_bytes = self.matcher.memory_usage()
+            pairs = self.pairs
+            return {
+                'triggers': pairs,
+                'words': len(self.word_ids),
+                'users': len(self.watchers),
+                'index_bytes': index_bytes,
+                'matcher_bytes': matcher_bytes,
+                'bytes_per_trigger': (index_bytes + matcher_bytes) / pairs if pairs else 0.0,
+            }
+
+    def __len__(self):
+        return self.pairs
+
+    def _new_word(self, word):
+        word = sys.intern(word)
+        if self._free_ids:
+            word_id = self._free_ids.pop()
+            self.words[word_id] = word
+            self.postings[word_id] = array('q')
+        else:
+            word_id = len(self.words)
+            self.words.append(word)
+            self.postings.append(array('q'))
+        self.word_ids[word] = word_id
+        self._update_matcher(True, word)
+        return word_id
+
+    def _free_word(self, word_id):
+        word = self.words[word_id]
+        del self.word_ids[word]
+        self.words[word_id] = None
+        self.postings[word_id] = None
+        self._free_ids.append(word_id)
+        self._update_matcher(False, word)
+
+    def _new_matcher(self, words=()):
+        return PhraseMatcher(words) if self.whole_words else AhoCorasick(words)
+
+    def _update_matcher(self, added, word):
+        """Apply one change to the matcher; call with the lock held"""
+        if added:
+            self.matcher.add(word)
+        else:
+            self.matcher.remove(word)
+        if self._rebuild_changes is not None:
+            self._rebuild_changes.append((added, word))
+        elif not self.whole_words and self.matcher.needs_rebuild():
+            # Building an automaton takes seconds for large trigger sets, so do it
+            # on a thread of its own and swap it in, never under the lock
+            self._rebuild_changes = []
+            threading.Thread(
+                target=self._rebuild_matcher, args=(list(self.word_ids), self._rebuild_changes),
+                name='trigger-matcher-rebuild', daemon=True
+            ).start()
+
+    def _rebuild_matcher(self, words, changes):
+        matcher = self._new_matcher(words)
+        with self._lock:
+            if self._rebuild_changes is not changes:
+                return  # A full load replaced the matcher meanwhile
+            for added, word in changes:
+                if added:
+                    matcher.add(word)
+                else:
+                    matcher.remove(word)
+            self.matcher = matcher
+            self._rebuild_changes = None
+
+
+# Global instance
+trigger_index = TriggerIndex()
@@ -1,5 +1,10 @@
+import logging
 import discord
-from database import add_multiple_trigger_words
+from async_database import add_multiple_trigger_words
+from database import MAX_TRIGGERS_PER_USER
+from guild_watchers import guild_watchers
+
+logger = logging.getLogger(__name__)
 
 class AddMultipleWordsModal(discord.ui.Modal, title='Add Multiple Words'):
     words_input = discord.ui.TextInput(
@@ -12,7 +17,7 @@ class AddMultipleWordsModal(discord.ui.Modal, title='Add Multiple Words'):
 
     async def on_submit(self, interaction: discord.Interaction):
         # Parse the input
-        words_list = [word.strip() for word in self.words_input.value.split(',')]
+        words_list = [' '.join(word.split()) for word in self.words_input.value.split(',')]
         words_list = [w for w in words_list if w]  # Remove empty strings
         
         if not words_list:
@@ -20,7 +25,10 @@ class AddMultipleWordsModal(discord.ui.Modal, title='Add Multiple Words'):
             return
         
         # Add words to database
-        added, duplicates = add_multiple_trigger_words(interaction.user.id, words_list)
+        added, duplicates, over_limit = await add_multiple_trigger_words(interaction.user.id, words_list)
+        
+        if added:
+            guild_watchers.refresh_user(interaction.client, interaction.user.id)
         
         # Build response message
         response_parts = []
@@ -31,8 +39,13 @@ class AddMultipleWordsModal(discord.ui.Modal, title='Add Multiple Words'):
         if duplicates:
             response_parts.append(f"**Already watching:** {', '.join(f'`{w}`' for w in duplicates)}")
         
+        if over_limit:
+            response_parts.append(
+                f"**Not added (limit of {MAX_TRIGGERS_PER_USER} words reached):** {', '.join(f'`{w}`' for w in over_limit)}"
+            )
+        
         if not added and not duplicates:
             response_parts.append("No words were added.")
         
         await interaction.response.send_message('\n'.join(response_parts), ephemeral=True)
-        print(f"User {interaction.user.name} added multiple words: {added}")
+        logger.info("User %s added multiple words: %s", interaction.user.name, added)
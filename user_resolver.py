@@ -0,0 +1,88 @@
+import os
+import time
+from collections import OrderedDict
+import discord
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '3600'))  # Seconds
+
+
+class LRUCache:
+    """Small LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class UserResolver:
+    """Resolve user IDs to users and DM channels, only using REST on a cache miss"""
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.users = LRUCache(max_size, ttl)
+        self.dm_channels = LRUCache(max_size, ttl)  # user_id -> DM channel ID
+
+        # Statistics
+        self.hits = 0
+        self.rest_calls = 0
+
+    async def get_user(self, bot, user_id, guild=None):
+        """Find a user in the gateway caches, falling back to fetch_user"""
+        user = guild.get_member(user_id) if guild else None
+        if user is None:
+            user = bot.get_user(user_id) or self.users.get(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+
+        self.rest_calls += 1
+        user = await bot.fetch_user(user_id)
+        self.users.put(user_id, user)
+        return user
+
+    async def get_dm_channel(self, bot, user_id, guild=None):
+        """Get a messageable DM channel for a user, opening one only if needed"""
+        channel_id = self.dm_channels.get(user_id)
+        if channel_id is not None:
+            self.hits += 1
+            return bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+
+        user = await self.get_user(bot, user_id, guild)
+        channel = user.dm_channel
+        if channel is None:
+            self.rest_calls += 1
+            channel = await user.create_dm()
+        self.dm_channels.put(user_id, channel.id)
+        return channel
+
+    def forget(self, user_id):
+        """Drop cached entries for a user, e.g. after their DM channel went missing"""
+        self.users.discard(user_id)
+        self.dm_channels.discard(user_id)
+
+# Global instance
+user_resolver = UserResolver()
@@ -0,0 +1,102 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import psycopg2
+from aiohttp import web
+from bags_service import bags_service, BAGS_WEBHOOK_PORT
+
+logger = logging.getLogger(__name__)
+
+BAGS_WEBHOOK_HOST = os.environ.get('BAGS_WEBHOOK_HOST', '0.0.0.0')
+BAGS_WEBHOOK_PATH = os.environ.get('BAGS_WEBHOOK_PATH', '/bags/claims')
+BAGS_WEBHOOK_SECRET = os.environ.get('BAGS_WEBHOOK_SECRET')
+BAGS_WEBHOOK_MAX_SKEW = 300  # Seconds a signed request stays valid, to stop replays
+
+SIGNATURE_HEADER = 'X-Bags-Signature'
+TIMESTAMP_HEADER = 'X-Bags-Timestamp'
+
+# Fields every pushed event needs, and the JSON types the claim_events columns accept
+REQUIRED_EVENT_FIELDS = {
+    'signature': (str,),
+    'wallet': (str,),
+    'amount': (str, int, float),
+    'timestamp': (str, int),
+}
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 over "<timestamp>.<body>", hex encoded"""
+    return hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, timestamp: str, body: bytes, signature: str) -> bool:
+    """Check a request's signature and that it was signed recently"""
+    try:
+        if abs(time.time() - int(timestamp)) > BAGS_WEBHOOK_MAX_SKEW:
+            return False
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(sign_payload(secret, timestamp, body), signature or '')
+
+
+def event_error(event) -> str:
+    """Why a pushed claim event can't be stored, or '' if it is valid"""
+    if not isinstance(event, dict):
+        return 'not an object'
+    for field, types in REQUIRED_EVENT_FIELDS.items():
+        value = event.get(field)
+        # bool is an int subclass but never a valid amount or timestamp
+        if value is None or value == '' or isinstance(value, bool) or not isinstance(value, types):
+            return f'missing or invalid "{field}"'
+    if not isinstance(event.get('isCreator', False), bool):
+        return 'invalid "isCreator"'
+    return ''
+
+
+async def handle_claim_events(request: web.Request) -> web.Response:
+    """Accept {"tokenMint": ..., "events": [...]} and feed it to the claim pipeline"""
+    body = await request.read()
+    if not verify_signature(BAGS_WEBHOOK_SECRET, request.headers.get(TIMESTAMP_HEADER),
+                            body, request.headers.get(SIGNATURE_HEADER)):
+        return web.json_response({'error': 'invalid signature'}, status=401)
+
+    try:
+        payload = json.loads(body)
+        token_mint = payload['tokenMint']
+        events = payload['events']
+        if not isinstance(token_mint, str) or not isinstance(events, list):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({'error': 'expected {"tokenMint": str, "events": [...]}'}, status=400)
+
+    # Reject the batch up front rather than failing halfway through the insert
+    for i, event in enumerate(events):
+        error = event_error(event)
+        if error:
+            return web.json_response({'error': f'event {i}: {error}'}, status=400)
+
+    try:
+        new_events = await bags_service.ingest_pushed_events(token_mint, events)
+    except psycopg2.errors.ForeignKeyViolation:
+        return web.json_response({'error': f'token {token_mint} is not monitored'}, status=404)
+
+    logger.debug("Webhook delivered %s claim event(s) for %s, %s new", len(events), token_mint, len(new_events))
+    return web.json_response({'received': len(events), 'new': len(new_events)})
+
+
+async def start_webhook_server():
+    """Start the push endpoint; returns the runner to clean up on shutdown"""
+    if not BAGS_WEBHOOK_SECRET:
+        raise ValueError("BAGS_WEBHOOK_SECRET environment variable not set")
+
+    app = web.Application(client_max_size=1024 * 1024)
+    app.router.add_post(BAGS_WEBHOOK_PATH, handle_claim_events)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, BAGS_WEBHOOK_HOST, int(BAGS_WEBHOOK_PORT)).start()
+    logger.info("Listening for Bags claim webhooks on %s:%s%s", BAGS_WEBHOOK_HOST, BAGS_WEBHOOK_PORT, BAGS_WEBHOOK_PATH)
+    return runner